@@ -59,6 +59,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'manhwas.profiling.RequestProfilingMiddleware',
+    'manhwas.profiling.RepeatedQueriesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -171,6 +173,54 @@ STATICFILES_DIRS = [BASE_DIR / 'static']  # initial root static
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# cache of home grid & manhwa details: CACHE_BACKEND=locmem (one per process), file (CACHE_LOCATION is a dir)
+# or redis (CACHE_LOCATION is a url, shared by all workers so hit ratio & invalidation are global)
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# buffered manhwa views, saved by `manage.py flush_views`
+VIEW_BUFFER_DIR = BASE_DIR / 'var' / 'view_buffer'
+
+# episode downloads: empty streams files from django, or an internal nginx location (e.g. '/protected/')
+# that serves MEDIA_ROOT, then django only sends X-Accel-Redirect and nginx streams the file & ranges
+EPISODE_DOWNLOAD_ACCEL_REDIRECT = os.getenv('EPISODE_DOWNLOAD_ACCEL_REDIRECT', '')
+
+# count of counter shards for comment reactions, 0 updates comment row directly.
+# shards are merged into comments by `manage.py compact_reaction_shards`
+COMMENT_REACTION_COUNTER_SHARDS = int(os.getenv('COMMENT_REACTION_COUNTER_SHARDS', 0))
+
+# per request sql & timing json log (manhwas.profiling), sample rate 0 disables it.
+# views: comma separated url names that are profiled, empty for all views
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', 0))
+REQUEST_PROFILING_VIEWS = [name for name in os.getenv('REQUEST_PROFILING_VIEWS', '').split(',') if name]
+REQUEST_PROFILING_SERVER_TIMING = bool(os.getenv('REQUEST_PROFILING_SERVER_TIMING'))
+REQUEST_PROFILING_SLOWEST_QUERIES = 5
+
+# N+1 detection of requests (manhwas.profiling): '' off, 'log' (staging) or 'raise' (development)
+N_PLUS_ONE_DETECTION = os.getenv('N_PLUS_ONE_DETECTION', '')
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'manhwas.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'manhwas.nplusone': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,8 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.db.models import Count, OuterRef, Subquery
+from django.template.response import TemplateResponse
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
 
+from .forms import EpisodeArchiveForm
+from .ingest import ingest_episodes
 from .models import Manhwa, Episode, Studio, Genre, Rate, View, CommentReAction, Comment, Ticket, TicketMessage
 
 
@@ -20,6 +24,7 @@ class ManhwaAdmin(admin.ModelAdmin):
     list_filter = ['genres', 'day_of_week', 'studio']
     search_fields = ['en_title']
     inlines = [EpisodeInline]
+    actions = ['upload_episodes']
 
     def get_queryset(self, request):
         return super(ManhwaAdmin, self)\
@@ -34,13 +39,6 @@ class ManhwaAdmin(admin.ModelAdmin):
                     .annotate(count=Count('id'))
                     .values('count')
                 ),
-                comments_count=Subquery(
-                    Comment.objects
-                    .filter(manhwa=OuterRef('pk'))
-                    .values('manhwa')
-                    .annotate(count=Count('id'))
-                    .values('count')
-                )
             )
 
     def get_genres(self, obj):
@@ -52,11 +50,44 @@ class ManhwaAdmin(admin.ModelAdmin):
         url = reverse('admin:manhwas_episode_changelist') + "?" + urlencode({'manhwa__id': manhwa.id})
         return format_html('<a href="{}">{}</a>', url, manhwa.episodes_count or 0)
 
+    @admin.action(description='Upload episodes from zip archive')
+    def upload_episodes(self, request, queryset):
+        if len(queryset) != 1:
+            self.message_user(request, 'select one manhwa to upload its episodes.', messages.ERROR)
+            return None
+        manhwa = queryset[0]
+
+        if 'apply' in request.POST:
+            form = EpisodeArchiveForm(request.POST, request.FILES)
+            if form.is_valid():
+                try:
+                    result = ingest_episodes(manhwa, form.cleaned_data['archive'])
+                except ValueError as error:  # e.g. same file name in two folders of archive
+                    self.message_user(request, str(error), messages.ERROR)
+                    return None
+                self.message_user(
+                    request,
+                    f'{result["created"]} episodes added to {manhwa} ({result["files"] - result["created"]} existed).',
+                    messages.SUCCESS,
+                )
+                return None
+        else:
+            form = EpisodeArchiveForm()
+
+        return TemplateResponse(request, 'admin/manhwas/manhwa/upload_episodes.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Upload episodes',
+            'opts': self.model._meta,
+            'manhwa': manhwa,
+            'form': form,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
     @admin.display(description='Comments', ordering='comments_count')
     def comments_count(self, manhwa):
         url = reverse('admin:manhwas_comment_changelist') + '?' + urlencode({'manhwa__id': manhwa.id})
 
-        return format_html('<a href="{}">{}</a>', url, manhwa.comments_count or 0)
+        return format_html('<a href="{}">{}</a>', url, manhwa.comments_count)
 
 
 @admin.register(View)
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.db import transaction
+
+# name of versioned cached contents
+HOME_GRID = 'home_grid'
+MANHWA_DETAIL = 'manhwa_detail'  # one version per manhwa, see manhwa_detail_name
+
+METRICS = 'cache_metrics'
+
+
+def manhwa_detail_name(manhwa_id):
+    """versioned content name of api payload & rendered page of one manhwa"""
+    return f'{MANHWA_DETAIL}:{manhwa_id}'
+
+
+def get_version(name):
+    """current version of a cached content, used in its cache keys"""
+    return cache.get_or_set(f'{name}:version', 1, timeout=None)
+
+
+def bump_version(name):
+    """invalidate all cache keys of a content by changing its version"""
+    try:
+        cache.incr(f'{name}:version')
+    except ValueError:  # version key not exist or expired
+        cache.set(f'{name}:version', 1, timeout=None)
+
+
+def bump_version_on_commit(name):
+    """
+    bump version now and again after commit: a request that read the old rows before commit
+    could have cached them with the bumped version.
+    """
+    bump_version(name)
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def _count(kind, event):
+    key = f'{METRICS}:{kind}:{event}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):  # added by another process
+            cache.incr(key)
+
+
+def get_or_build(name, part, build, timeout):
+    """
+    cached part of a versioned content, build() result is cached on a miss.
+    hits & misses are counted by kind of content (name without its id), see cache_metrics.
+    """
+    kind = name.split(':', 1)[0]
+    key = f'{name}:{get_version(name)}:{part}'
+    value = cache.get(key)
+    if value is None:
+        _count(kind, 'misses')
+        value = build()
+        cache.set(key, value, timeout)
+    else:
+        _count(kind, 'hits')
+    return value
+
+
+def cache_metrics(kinds=(HOME_GRID, MANHWA_DETAIL)):
+    """hits, misses & hit ratio of each kind of cached content since last reset"""
+    counts = cache.get_many([f'{METRICS}:{kind}:{event}' for kind in kinds for event in ('hits', 'misses')])
+    metrics = {}
+    for kind in kinds:
+        hits, misses = counts.get(f'{METRICS}:{kind}:hits', 0), counts.get(f'{METRICS}:{kind}:misses', 0)
+        metrics[kind] = {
+            'hits': hits, 'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return metrics
+
+
+def reset_cache_metrics(kinds=(HOME_GRID, MANHWA_DETAIL)):
+    cache.delete_many([f'{METRICS}:{kind}:{event}' for kind in kinds for event in ('hits', 'misses')])
@@ -0,0 +1,64 @@
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def rows_tag(rows, meta=None, counter_fields=()):
+    """
+    validator of fetched rows, from their ids & datetime_modified (not their serialized payload),
+    page metadata (count, links) and values of counter_fields, which are updated without datetime_modified.
+    """
+    rows = [(row.pk, row.datetime_modified, *(getattr(row, field) for field in counter_fields)) for row in rows]
+    return md5(repr((rows, meta)).encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    generic viewset mixin that answers list & retrieve with 304 (without serializing rows)
+    when If-None-Match of client still matches. validators come from the rows that are fetched anyway,
+    so no query is added.
+
+    retrieve of rows without counter_fields also has Last-Modified (If-Modified-Since), lists only have ETag:
+    latest datetime_modified of a page can go back when a row is removed from it.
+    """
+    counter_fields = ()  # fields of rows in payload that are updated without datetime_modified
+
+    def conditional_response(self, tag, respond, last_modified=None):
+        # same url can be rendered as json or browsable api
+        etag = quote_etag(f'{tag}-{self.request.accepted_renderer.format}')
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = respond()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            rows, meta = list(queryset), None
+        else:
+            rows, meta = page, dict(self.get_paginated_response([]).data)
+
+        def respond():
+            data = self.get_serializer(rows, many=True).data
+            return Response(data) if page is None else self.get_paginated_response(data)
+
+        return self.conditional_response(rows_tag(rows, meta, self.counter_fields), respond)
+
+    def object_validators(self, instance):
+        """(tag, last_modified) of one object, last_modified is None if its counters can change without it"""
+        last_modified = None if self.counter_fields else instance.datetime_modified
+        return rows_tag([instance], counter_fields=self.counter_fields), last_modified
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        tag, last_modified = self.object_validators(instance)
+        return self.conditional_response(tag, lambda: Response(self.get_serializer(instance).data), last_modified)
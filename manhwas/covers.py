@@ -0,0 +1,182 @@
+"""
+resized copies (variants) of manhwa covers in several widths and formats, for srcset of cards and apis.
+
+variants are made by process_covers command (a worker, off the request path) for manhwas whose cover changed
+since their variants were made. names of variants only depend on name of cover (manhwa_cover_variant_name),
+so a run is idempotent and an interrupted run is continued by the next one: variants already in storage are kept.
+
+placeholders of covers are made when a cover is uploaded (Manhwa.save), backfill_placeholders makes them for
+covers uploaded before.
+"""
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import django
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError, features
+
+from .cache import HOME_GRID, bump_version
+from .models import Manhwa, manhwa_cover_variant_name
+from .placeholders import image_placeholder
+from .signals import invalidate_manhwa_detail
+
+logger = logging.getLogger('manhwas.covers')
+
+# cards are 200px wide, 2x & 3x for dense screens
+COVER_WIDTHS = (200, 400, 600)
+# format: (pillow format, save options), best format first
+COVER_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+if features.check('avif'):  # pillow built with libavif
+    COVER_FORMATS = {'avif': ('AVIF', {'quality': 60}), **COVER_FORMATS}
+
+
+def process_pool(workers):
+    """
+    context manager of a pool of worker processes, None (work in this process) for 0 workers.
+    processes are spawned, so they don't share db connections of this process.
+    """
+    if not workers:
+        return nullcontext()
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+
+
+def variant_widths(width):
+    """widths of variants of a cover, covers are not enlarged"""
+    return [variant for variant in COVER_WIDTHS if variant < width] or [width]
+
+
+def _display_width(image):
+    # exif orientations 5 - 8 turn the image by 90 degrees
+    return image.height if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8) else image.width
+
+
+def _encode(image, image_format):
+    pillow_format, options = COVER_FORMATS[image_format]
+    if image.mode == 'RGBA' and pillow_format == 'JPEG':
+        image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image).convert('RGB')
+    content = io.BytesIO()
+    image.save(content, pillow_format, **options)
+    return content.getvalue()
+
+
+def make_cover_variants(cover_name, storage=default_storage):
+    """
+    save missing variants of a cover to storage. returns: {format: [widths]}
+    raises OSError if cover is missing or is not an image.
+    """
+    with storage.open(cover_name, 'rb') as file:
+        image = Image.open(file)
+        widths = variant_widths(_display_width(image))
+        variants = {image_format: widths for image_format in COVER_FORMATS}
+        missing = {
+            (width, image_format) for width in widths for image_format in COVER_FORMATS
+            if not storage.exists(manhwa_cover_variant_name(cover_name, width, image_format))
+        }
+        if not missing:
+            return variants
+
+        # jpeg is decoded at a smaller scale, still at least as big as the largest variant
+        image.draft('RGB', (widths[-1], widths[-1]))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+    for width in sorted({width for width, _ in missing}):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS, reducing_gap=3)
+        for image_format in COVER_FORMATS:
+            if (width, image_format) in missing:
+                name = manhwa_cover_variant_name(cover_name, width, image_format)
+                storage.save(name, ContentFile(_encode(resized, image_format)))
+    return variants
+
+
+def _variants_or_none(cover_name):
+    """
+    runs in workers of pool, a failed cover should not stop other covers.
+    returns: variants, {} for a cover that can't be decoded, None for other errors (e.g. storage), retried later
+    """
+    try:
+        return make_cover_variants(cover_name)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('cover %s is not a decodable image, no variants are made', cover_name, exc_info=True)
+        return {}
+    except OSError:
+        logger.warning('variants of cover %s are not made, it will be retried', cover_name, exc_info=True)
+        return None
+
+
+def pending_covers():
+    """(id, cover name) of manhwas whose variants are not made from their current cover"""
+    return Manhwa.objects.exclude(cover='').exclude(cover_variants_source=F('cover')).order_by('id').values_list(
+        'id', 'cover'
+    )
+
+
+def process_covers(executor=None, batch_size=100, failed=None):
+    """
+    make variants of one batch of pending covers, in processes of executor (or in this process).
+    a cover that changes while its variants are made stays pending, a cover that fails with a storage
+    error stays pending too and its manhwa id is added to failed set, which is skipped by next batches.
+    returns: count of covers whose variants are saved
+    """
+    failed = set() if failed is None else failed
+    pending = list(pending_covers().exclude(id__in=failed)[:batch_size])
+    if not pending:
+        return 0
+
+    names = [cover for _, cover in pending]
+    results = executor.map(_variants_or_none, names) if executor else map(_variants_or_none, names)
+    updated = 0
+    for (manhwa_id, cover), variants in zip(pending, results):
+        if variants is None:
+            failed.add(manhwa_id)
+            continue
+        updated += Manhwa.objects.filter(pk=manhwa_id, cover=cover).update(
+            cover_variants=variants, cover_variants_source=cover, datetime_modified=timezone.now(),
+        )
+        invalidate_manhwa_detail(manhwa_id)
+    bump_version(HOME_GRID)
+    return updated
+
+
+def _placeholder_or_empty(cover_name):
+    # runs in workers of pool
+    try:
+        with default_storage.open(cover_name, 'rb') as file:
+            return image_placeholder(file)
+    except (OSError, Image.DecompressionBombError):
+        logger.warning('placeholder of cover %s is not made', cover_name, exc_info=True)
+        return '', ''
+
+
+def backfill_placeholders(executor=None, batch_size=100, after=0, recompute=False):
+    """
+    make placeholder & dominant color of next batch of covers (id > after) that have none (all covers if recompute),
+    in processes of executor. returns: (count of processed covers, last id of batch)
+    """
+    manhwas = Manhwa.objects.exclude(cover='').filter(id__gt=after)
+    if not recompute:
+        manhwas = manhwas.filter(cover_placeholder='')
+    batch = list(manhwas.order_by('id').values_list('id', 'cover')[:batch_size])
+    if not batch:
+        return 0, after
+
+    names = [cover for _, cover in batch]
+    results = executor.map(_placeholder_or_empty, names) if executor else map(_placeholder_or_empty, names)
+    for (manhwa_id, cover), (placeholder, color) in zip(batch, results):
+        # a cover uploaded meanwhile has its own placeholder
+        Manhwa.objects.filter(pk=manhwa_id, cover=cover).update(
+            cover_placeholder=placeholder, cover_color=color, datetime_modified=timezone.now(),
+        )
+        invalidate_manhwa_detail(manhwa_id)
+    bump_version(HOME_GRID)
+    return len(batch), batch[-1][0]
@@ -1,7 +1,9 @@
 from django_filters import FilterSet
+from rest_framework.filters import OrderingFilter
 
 from .models import Manhwa
 
+
 class ManhwaFilter(FilterSet):
     class Meta:
         model = Manhwa
@@ -10,4 +12,18 @@ class ManhwaFilter(FilterSet):
             'genres': ('exact',),
             'studio': ('exact',),
             'avg_rating': ('exact',),
-        }
\ No newline at end of file
+        }
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    ordering filter that appends id to requested ordering,
+    so rows with same value (e.g. avg_rating) keep same order between pages.
+    direction of id follows the last ordering field to use indexes like (-avg_rating, -id).
+    """
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            return ordering
+
+        return (*ordering, '-id' if ordering[-1].startswith('-') else 'id')
@@ -2,6 +2,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 
 from re import search
+import zipfile
 
 from .models import Comment
 
@@ -18,3 +19,13 @@ class CommentForm(forms.ModelForm):
             raise ValidationError('text cant be included html tags.')
 
         return text
+
+
+class EpisodeArchiveForm(forms.Form):
+    archive = forms.FileField(help_text='zip archive of episode files, added in order of file names')
+
+    def clean_archive(self):
+        archive = self.cleaned_data['archive']
+        if not zipfile.is_zipfile(archive):
+            raise ValidationError('file is not a zip archive.')
+        return archive
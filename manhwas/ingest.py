@@ -0,0 +1,145 @@
+"""
+bulk ingestion of episode files of a manhwa (season uploads) from a directory or zip archive.
+
+files are ordered by name (numbers in names compared as numbers) and streamed to storage at names of
+manhwa_file_upload_to. files are identified by sha256 of their content (Episode.file_hash), so a run can be
+repeated after an interruption: files that already have an episode are skipped and a file uploaded by the
+interrupted run (same content, no episode) is not uploaded again. a file of an episode is never replaced,
+new content with a taken name is saved under another name.
+"""
+import hashlib
+import os
+import re
+import zipfile
+from collections import namedtuple
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .cache import HOME_GRID, bump_version
+from .models import Episode, Manhwa
+from .signals import invalidate_manhwa_detail
+
+# open: callable that returns a binary file object of content
+EpisodeSource = namedtuple('EpisodeSource', ('name', 'size', 'open'))
+
+
+def natural_key(name):
+    """sort key of file names: 'episode-2' before 'episode-10'"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def _is_episode_file(path):
+    # hidden files and folders of archive tools (.DS_Store, __MACOSX/) are not episodes
+    return not any(part.startswith('.') or part == '__MACOSX' for part in path.split('/'))
+
+
+def _open_path(path):
+    return lambda: open(path, 'rb')
+
+
+def episode_sources(source):
+    """
+    EpisodeSource of each file in source, in natural order of names.
+    source: path of a directory, path of a zip archive or an opened zip file (e.g. uploaded in admin)
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        sources = []
+        for name in os.listdir(source):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and _is_episode_file(name):
+                sources.append(EpisodeSource(name, os.path.getsize(path), _open_path(path)))
+    elif zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        sources = [
+            EpisodeSource(os.path.basename(info.filename), info.file_size, lambda info=info: archive.open(info))
+            for info in archive.infolist() if not info.is_dir() and _is_episode_file(info.filename)
+        ]
+    else:
+        raise ValueError(f'{source} is not a directory or zip archive.')
+
+    names = [item.name for item in sources]
+    if len(set(names)) != len(names):
+        raise ValueError('file names of episodes are not unique.')
+    return sorted(sources, key=lambda item: natural_key(item.name))
+
+
+def content_hash(file, chunk_size=1024 * 1024):
+    """sha256 hex digest of a binary file object, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_episode_file(manhwa, item, file_hash, storage=default_storage):
+    """
+    stream content of item to storage, in chunks. returns: (name in storage, uploaded)
+    a file of no episode with same content is kept (uploaded by an interrupted run), other content of
+    such a file (partial upload) is replaced. file of an episode is kept and item gets an available name.
+    """
+    name = Episode._meta.get_field('file').generate_filename(Episode(manhwa=manhwa), item.name)
+    if storage.exists(name) and not Episode.objects.filter(file=name).exists():
+        with storage.open(name, 'rb') as stored:
+            if content_hash(stored) == file_hash:
+                return name, False
+        storage.delete(name)
+
+    with item.open() as content:
+        file = File(content, name=item.name)
+        file.size = item.size
+        return storage.save(name, file), True  # save never overwrites, a taken name gets a suffix
+
+
+def ingest_episodes(manhwa, source, storage=default_storage, progress=None):
+    """
+    upload files of source as next episodes of manhwa. numbers of new episodes are reserved at once,
+    episodes are added by one bulk_create and last_upload of manhwa is set once.
+    progress: called with (index, count, name, uploaded) after each new file is in storage.
+    raises ValueError if two files of source have same content.
+
+    returns: {files, uploaded, created, first_number, last_number}
+    """
+    sources = episode_sources(source)
+    hashes = []
+    for item in sources:
+        with item.open() as content:
+            hashes.append(content_hash(content))
+    if len(set(hashes)) != len(hashes):
+        raise ValueError('contents of episode files are not unique.')
+
+    existing = set(Episode.objects.filter(manhwa=manhwa, file_hash__in=hashes).values_list('file_hash', flat=True))
+    new_files = [(item, file_hash) for item, file_hash in zip(sources, hashes) if file_hash not in existing]
+    uploaded_files, uploaded = [], 0
+    for index, (item, file_hash) in enumerate(new_files, start=1):
+        name, is_uploaded = upload_episode_file(manhwa, item, file_hash, storage)
+        uploaded_files.append((name, file_hash))
+        uploaded += is_uploaded
+        if progress:
+            progress(index, len(new_files), name, is_uploaded)
+
+    with transaction.atomic():
+        # one ingestion of manhwa at a time, so an episode is not added twice by concurrent runs
+        list(Manhwa.objects.select_for_update().filter(pk=manhwa.pk).values_list('pk', flat=True))
+        existing = set(Episode.objects.filter(manhwa=manhwa, file_hash__in=hashes).values_list('file_hash', flat=True))
+        new_episodes = [(name, file_hash) for name, file_hash in uploaded_files if file_hash not in existing]
+        first_number = None
+        if new_episodes:
+            first_number = Episode.objects.reserve_numbers(manhwa.pk, len(new_episodes))
+            Episode.objects.bulk_create([
+                Episode(manhwa=manhwa, number=first_number + offset, file=name, file_hash=file_hash)
+                for offset, (name, file_hash) in enumerate(new_episodes)
+            ])
+
+    if new_episodes:  # bulk_create sends no post_save signal
+        bump_version(HOME_GRID)
+        invalidate_manhwa_detail(manhwa.pk)
+
+    return {
+        'files': len(sources),
+        'uploaded': uploaded,
+        'created': len(new_episodes),
+        'first_number': first_number,
+        'last_number': first_number + len(new_episodes) - 1 if new_episodes else None,
+    }
@@ -0,0 +1,145 @@
+"""shared helpers of bench_* commands, not a command itself"""
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import DatabaseError, close_old_connections, connection
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from manhwas.models import (
+    Comment, CommentReAction, Episode, Genre, Manhwa, Rate, Studio, Ticket, TicketMessage, View
+)
+from manhwas.reconcile import reconcile_comment_reactions, reconcile_manhwa_views
+
+BENCH_PHONE_PREFIX = '0990'
+
+
+@contextmanager
+def bench_data(users_count):
+    """temporary hot manhwa and users, removed on exit"""
+    studio = Studio.objects.create(title='bench studio', description='bench')
+    manhwa = Manhwa.objects.create(
+        en_title='bench hot manhwa', summary='bench', day_of_week=Manhwa.SATURDAY,
+        cover='bench.jpg', publication_datetime=timezone.now(), studio=studio,
+    )
+    users = CustomUser.objects.bulk_create([
+        CustomUser(phone_number=f'{BENCH_PHONE_PREFIX}{i:07d}', username=f'bench-user-{i}', password='!')
+        for i in range(users_count)
+    ])
+    try:
+        yield manhwa, users
+    finally:
+        CustomUser.objects.filter(pk__in=[user.id for user in users]).delete()
+        manhwa.delete()
+        studio.delete()
+
+
+def run_threads(func, calls, threads):
+    """
+    call func(*args) for every args of calls in threads, each thread with its own db connection.
+    returns: (calls count, seconds, database errors count)
+    """
+    errors = []
+
+    def worker(chunk):
+        try:
+            for args in chunk:
+                try:
+                    func(*args)
+                except DatabaseError as e:  # e.g. lock timeout of hot row
+                    errors.append(e)
+        finally:
+            connection.close()
+
+    chunks = [calls[i::threads] for i in range(threads)]
+    close_old_connections()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(worker, chunks))
+    return len(calls), time.perf_counter() - start, len(errors)
+
+
+def report(stdout, mode, count, seconds, errors):
+    stdout.write(f'{mode}: {count} requests in {seconds:.3f}s, {count / seconds:.0f} req/s, {errors} errors')
+
+
+def seed_dataset(manhwas=20, episodes=10, comments=20, users=30, seed=0):
+    """
+    create manhwas with episodes, genres, rates and views of all users,
+    top level comments with 2 replies, each reply with 1 reply (3 levels), reactions of users on comments,
+    and 2 tickets with 3 messages for every user. counters of manhwas & comments are kept right.
+    must be called in a transaction that is rolled back, created rows are not removed.
+
+    returns: dict of sample objects used in requests: user, manhwa, comment, reply, episode, ticket
+    """
+    rand = random.Random(seed)
+    now = timezone.now()
+    studio = Studio.objects.create(title='bench studio', description='bench')
+    genres = Genre.objects.bulk_create([Genre(title=f'bench genre {i}', description='bench') for i in range(5)])
+    users = CustomUser.objects.bulk_create([
+        CustomUser(phone_number=f'{BENCH_PHONE_PREFIX}{i:07d}', username=f'bench-user-{i}', password='!')
+        for i in range(users)
+    ])
+    manhwas = Manhwa.objects.bulk_create([
+        Manhwa(
+            en_title=f'bench manhwa {i}', summary='bench', day_of_week=Manhwa.SATURDAY, cover='bench.jpg',
+            publication_datetime=now, studio=studio, last_upload=f'S01-E{episodes:02d}',
+            comments_count=comments * 5, next_episode_number=episodes + 1,
+        ) for i in range(manhwas)
+    ])
+    Manhwa.genres.through.objects.bulk_create([
+        Manhwa.genres.through(manhwa=manhwa, genre=genre) for manhwa in manhwas for genre in rand.sample(genres, 2)
+    ])
+    Episode.objects.bulk_create([
+        Episode(manhwa=manhwa, number=number, file='bench.pdf')
+        for manhwa in manhwas for number in range(1, episodes + 1)
+    ])
+    Rate.objects.bulk_create([
+        Rate(user=user, manhwa=manhwa, rating=rand.randint(1, 5)) for manhwa in manhwas for user in users
+    ])
+    View.objects.bulk_create([View(user=user, manhwa=manhwa) for manhwa in manhwas for user in users])
+
+    # comments of each level are created together, replies need ids of parents
+    parents = Comment.objects.bulk_create([
+        Comment(author=users[i % len(users)], manhwa=manhwa, text=f'bench comment {i}', replies_count=2)
+        for manhwa in manhwas for i in range(comments)
+    ])
+    replies = Comment.objects.bulk_create([
+        Comment(author=users[(i + 1) % len(users)], manhwa_id=parent.manhwa_id, parent=parent, level=1,
+                text=f'bench reply {parent.id}-{i}', replies_count=1)
+        for parent in parents for i in range(2)
+    ])
+    Comment.objects.bulk_create([
+        Comment(author=users[0], manhwa_id=reply.manhwa_id, parent=reply, level=2, text=f'bench reply {reply.id}')
+        for reply in replies
+    ])
+    CommentReAction.objects.bulk_create([
+        CommentReAction(user=user, comment=comment, reaction=rand.choice((CommentReAction.LIKE, CommentReAction.DISLIKE)))
+        for comment in parents + replies for user in rand.sample(users, min(len(users), 5))
+    ])
+    Rate.objects.sync_manhwa_rating_counters()
+    reconcile_comment_reactions()
+    reconcile_manhwa_views()
+
+    tickets = Ticket.objects.bulk_create([Ticket(title=f'bench ticket {i}', user=user) for user in users for i in range(2)])
+    TicketMessage.objects.bulk_create([
+        TicketMessage(ticket=ticket, user_id=ticket.user_id, text='bench') for ticket in tickets for _ in range(3)
+    ])
+
+    return {
+        'user': users[0],
+        'manhwa': manhwas[0],
+        'comment': parents[0],
+        'reply': replies[0],
+        'episode': Episode.objects.filter(manhwa=manhwas[0]).first(),
+        'ticket': tickets[0],
+    }
+
+
+def percentile(values, p):
+    """nearest-rank percentile of values, p in 0-100"""
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from manhwas.covers import backfill_placeholders, process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'make placeholder & dominant color of covers uploaded before they were made on upload, '
+        'in a pool of processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(), help='processes that read covers, 0 reads in this process'
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help='covers saved to db in each batch')
+        parser.add_argument('--all', action='store_true', help='make them again for covers that have them')
+
+    def handle(self, *args, **options):
+        total, after = 0, 0
+        with process_pool(options['workers']) as executor:
+            while True:
+                processed, after = backfill_placeholders(
+                    executor, batch_size=options['batch_size'], after=after, recompute=options['all']
+                )
+                if not processed:
+                    break
+                total += processed
+                self.stdout.write(f'{total} covers processed (last manhwa id {after}).')
+
+        self.stdout.write(self.style.SUCCESS(f'{total} placeholders made.'))
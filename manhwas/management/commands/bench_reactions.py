@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Case, When
+from django.test import override_settings
+
+from manhwas.models import Comment, CommentReAction, CommentReactionCounterShard
+
+from ._bench import bench_data, report, run_threads
+
+
+class Command(BaseCommand):
+    help = (
+        'contention benchmark of many concurrent reaction togglers on one comment, '
+        'with counters on comment row against sharded counters. '
+        'creates temporary users, manhwa and comment and removes them at the end. '
+        'run it on postgresql, sqlite allows one writer at a time and returns lock errors.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='togglers of hot comment')
+        parser.add_argument('--toggles', type=int, default=4, help='toggles sent by each user')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--shards', type=int, default=16)
+
+    def handle(self, *args, **options):
+        reactions = (CommentReAction.LIKE, CommentReAction.DISLIKE, CommentReAction.DISLIKE, CommentReAction.LIKE)
+
+        with bench_data(options['users']) as (manhwa, users):
+            comment = Comment.objects.create(author=users[0], manhwa=manhwa, text='bench hot comment')
+            calls = [
+                (user, comment.id, reactions[i % len(reactions)])
+                for i in range(options['toggles']) for user in users
+            ]
+
+            for shards in (0, options['shards']):
+                CommentReAction.objects.filter(comment=comment).delete()
+                CommentReactionCounterShard.objects.filter(comment=comment).delete()
+                Comment.objects.filter(pk=comment.id).update(likes_count=0, dis_likes_count=0)
+
+                with override_settings(COMMENT_REACTION_COUNTER_SHARDS=shards):
+                    mode = f'{shards} shards' if shards else 'comment row'
+                    report(self.stdout, mode, *run_threads(CommentReAction.objects.toggle_reaction, calls, options['threads']))
+                    self.check_counts(comment)
+
+    def check_counts(self, comment):
+        """counts summed on read and after compaction must be same as real count of reactions"""
+        real = CommentReAction.objects.filter(comment=comment).aggregate(
+            likes_count=Count(Case(When(reaction=CommentReAction.LIKE, then=1))),
+            dis_likes_count=Count(Case(When(reaction=CommentReAction.DISLIKE, then=1))),
+        )
+        summed = Comment.objects.with_reaction_counts().get(pk=comment.id).reaction_counts()
+        CommentReactionCounterShard.objects.compact()
+        compacted = Comment.objects.get(pk=comment.id).reaction_counts()
+
+        exact = real == summed == compacted
+        style = self.style.SUCCESS if exact else self.style.ERROR
+        self.stdout.write(style(f'real: {real}, summed on read: {summed}, compacted: {compacted}'))
@@ -0,0 +1,175 @@
+import json
+import os
+import time
+from collections import namedtuple
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import urls as accounts_urls
+from manhwas import urls as manhwas_urls
+from manhwas.cache import HOME_GRID, bump_version
+
+from ._bench import percentile, seed_dataset
+
+# url: path from seeded objects (d) and number of request (i), data: json body of request.
+# auth: 'jwt' for api, 'session' for pages. max_queries must not depend on size of dataset (no N+1).
+Route = namedtuple(
+    'Route', ('name', 'method', 'url', 'max_queries', 'data', 'auth', 'status', 'headers', 'label'),
+    defaults=(None, None, 200, None, None),
+)
+
+ROUTES = (
+    Route('home', 'GET', lambda d, i: reverse('home'), 3, auth='session'),
+    Route('manhwa_detail', 'GET', lambda d, i: reverse('manhwa_detail', args=[d['manhwa'].id]), 4, auth='session'),
+    Route('manhwa_detail', 'GET', lambda d, i: reverse('manhwa_detail', args=[d['manhwa'].id]), 5, auth='session',
+          headers={'Tab-Load': 'comments'}, label='manhwa_detail (comments tab)'),
+    Route('manhwa_detail', 'GET', lambda d, i: reverse('manhwa_detail', args=[d['manhwa'].id]), 1, auth='session',
+          headers={'Tab-Load': 'episodes'}, label='manhwa_detail (episodes tab)'),
+    Route('manhwa_comment_replies', 'GET',
+          lambda d, i: reverse('manhwa_comment_replies', args=[d['manhwa'].id, d['comment'].id]), 4, auth='session'),
+    Route('signup', 'GET', lambda d, i: reverse('signup'), 3, auth='session'),
+
+    Route('tickets', 'GET', lambda d, i: reverse('tickets'), 3, auth='jwt'),
+    Route('tickets', 'POST', lambda d, i: reverse('tickets'), 5, auth='jwt', status=201,
+          data=lambda d, i: {'title': f'bench ticket {i}', 'text': 'bench'}),
+    Route('ticket-messages', 'GET', lambda d, i: reverse('ticket-messages', args=[d['ticket'].id]), 4, auth='jwt'),
+    Route('ticket-messages', 'POST', lambda d, i: reverse('ticket-messages', args=[d['ticket'].id]), 5,
+          auth='jwt', status=201, data=lambda d, i: {'text': f'bench message {i}'}),
+
+    Route('manhwa-list', 'GET', lambda d, i: reverse('manhwa-list'), 2),
+    Route('manhwa-list', 'GET', lambda d, i: reverse('manhwa-list') + '?pagination=cursor', 1,
+          label='manhwa-list (cursor)'),
+    Route('manhwa-detail', 'GET', lambda d, i: reverse('manhwa-detail', args=[d['manhwa'].id]), 2),
+    Route('manhwa-set-view', 'POST', lambda d, i: reverse('manhwa-set-view', args=[d['manhwa'].id]), 2,
+          auth='jwt', status=202),
+    Route('manhwa-rate', 'GET', lambda d, i: reverse('manhwa-rate', args=[d['manhwa'].id]), 2, auth='jwt'),
+    Route('manhwa-rate', 'POST', lambda d, i: reverse('manhwa-rate', args=[d['manhwa'].id]), 6, auth='jwt',
+          data=lambda d, i: {'rating': i % 5 + 1}),
+
+    Route('manhwa-comments-list', 'GET', lambda d, i: reverse('manhwa-comments-list', args=[d['manhwa'].id]), 3),
+    Route('manhwa-comments-list', 'POST', lambda d, i: reverse('manhwa-comments-list', args=[d['manhwa'].id]), 4,
+          auth='jwt', status=201, data=lambda d, i: {'text': f'bench new comment {i}'}),
+    Route('manhwa-comments-detail', 'GET',
+          lambda d, i: reverse('manhwa-comments-detail', args=[d['manhwa'].id, d['comment'].id]), 2),
+    Route('manhwa-comments-replies', 'GET',
+          lambda d, i: reverse('manhwa-comments-replies', args=[d['manhwa'].id, d['comment'].id]), 2),
+    Route('manhwa-comments-reaction', 'POST',
+          lambda d, i: reverse('manhwa-comments-reaction', args=[d['manhwa'].id, d['reply'].id]), 6, auth='jwt',
+          data=lambda d, i: {'reaction': 'lk'}),
+    Route('comment-reactions-batch', 'POST', lambda d, i: reverse('comment-reactions-batch'), 9, auth='jwt',
+          data=lambda d, i: {'reactions': [{'comment_id': d['comment'].id, 'reaction': 'lk'},
+                                           {'comment_id': d['reply'].id, 'reaction': 'dlk'}]}),
+
+    Route('manhwa-episodes-list', 'GET', lambda d, i: reverse('manhwa-episodes-list', args=[d['manhwa'].id]), 1),
+    Route('manhwa-episodes-list', 'GET',
+          lambda d, i: reverse('manhwa-episodes-list', args=[d['manhwa'].id]) + '?pagination=cursor', 1,
+          label='manhwa-episodes-list (cursor)'),
+    Route('manhwa-episodes-detail', 'GET',
+          lambda d, i: reverse('manhwa-episodes-detail', args=[d['manhwa'].id, d['episode'].id]), 1),
+    Route('manhwa-episodes-download', 'GET',
+          lambda d, i: reverse('manhwa-episodes-download', args=[d['manhwa'].id, d['episode'].id]), 1),
+    Route('manhwa-episodes-download', 'GET',
+          lambda d, i: reverse('manhwa-episodes-download', args=[d['manhwa'].id, d['episode'].id]), 1,
+          headers={'Range': 'bytes=65536-'}, status=206, label='manhwa-episodes-download (range)'),
+)
+
+
+def route_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from route_names(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+class Command(BaseCommand):
+    help = (
+        'query count & latency (p50/p95) of every route of manhwas and accounts urls on a seeded dataset. '
+        'dataset is created in a transaction that is rolled back at the end. '
+        'fails if a route runs more queries than its upper bound or returns unexpected status.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--manhwas', type=int, default=20)
+        parser.add_argument('--episodes', type=int, default=10, help='episodes of each manhwa')
+        parser.add_argument('--comments', type=int, default=20, help='top level comments of each manhwa')
+        parser.add_argument('--users', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=20, help='requests sent to each route')
+        parser.add_argument('--output', help='write results as json to this file')
+
+    def handle(self, *args, **options):
+        covered = {route.name for route in ROUTES}
+        missing = set(route_names(manhwas_urls.urlpatterns + accounts_urls.urlpatterns)) - covered
+        if missing:
+            raise CommandError(f'routes without benchmark: {", ".join(sorted(missing))}')
+
+        dataset = {key: options[key] for key in ('manhwas', 'episodes', 'comments', 'users', 'seed')}
+        with TemporaryDirectory() as buffer_dir, override_settings(
+            VIEW_BUFFER_DIR=buffer_dir, MEDIA_ROOT=buffer_dir, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            with open(os.path.join(buffer_dir, 'bench.pdf'), 'wb') as file:  # file of seeded episodes
+                file.write(os.urandom(256 * 1024))
+            with transaction.atomic():
+                results = self.run_routes(seed_dataset(**dataset), options['requests'])
+                transaction.set_rollback(True)
+        bump_version(HOME_GRID)  # grids cached from rolled back rows
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'database': connection.vendor, 'dataset': dataset, 'routes': results}, file, indent=2)
+
+        failed = [result['route'] for result in results if not result['ok']]
+        if failed:
+            raise CommandError(f'failed routes: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} routes passed.'))
+
+    def run_routes(self, objects, requests):
+        client = Client(raise_request_exception=False)
+        client.force_login(objects['user'])
+        jwt = {'authorization': f'JWT {AccessToken.for_user(objects["user"])}'}
+
+        results = []
+        for route in ROUTES:
+            headers = {**(route.headers or {}), **(jwt if route.auth == 'jwt' else {})}
+            timings, queries, statuses = [], 0, set()
+            for i in range(requests):
+                kwargs = {'headers': headers}
+                if route.data:
+                    kwargs.update(data=json.dumps(route.data(objects, i)), content_type='application/json')
+
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = client.generic(route.method, route.url(objects, i), **kwargs)
+                    if response.streaming:  # file downloads are timed until last chunk (file is closed after it)
+                        for _ in response.streaming_content:
+                            pass
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries = max(queries, len(ctx.captured_queries))
+                statuses.add(response.status_code)
+
+            result = {
+                'route': route.label or route.name,
+                'method': route.method,
+                'status': sorted(statuses),
+                'queries': queries,
+                'max_queries': route.max_queries,
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'ok': statuses == {route.status} and queries <= route.max_queries,
+            }
+            results.append(result)
+            style = self.style.SUCCESS if result['ok'] else self.style.ERROR
+            self.stdout.write(style(
+                f'{route.method:6} {result["route"]:32} status {result["status"]} '
+                f'queries {queries}/{route.max_queries}  p50 {result["p50_ms"]}ms  p95 {result["p95_ms"]}ms'
+            ))
+
+        return results
@@ -0,0 +1,53 @@
+import time
+from tempfile import TemporaryDirectory
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.test import override_settings
+
+from manhwas.models import Manhwa, View
+from manhwas.view_buffer import flush_views, record_view
+
+from ._bench import bench_data, report, run_threads
+
+
+class Command(BaseCommand):
+    help = (
+        'load test of view counting on a single hot manhwa: '
+        'direct get_or_create + UPDATE per request against buffered views. '
+        'creates temporary users and a manhwa and removes them at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000, help='distinct viewers of hot manhwa')
+        parser.add_argument('--repeat', type=int, default=2, help='views sent by each user')
+        parser.add_argument('--threads', type=int, default=8)
+
+    def handle(self, *args, **options):
+        with bench_data(options['users']) as (manhwa, users):
+            calls = [(user.id, manhwa.id) for user in users] * options['repeat']
+
+            report(self.stdout, 'direct', *run_threads(self.direct_view, calls, options['threads']))
+            self.check_count(manhwa, len(users))
+
+            View.objects.filter(manhwa=manhwa).delete()
+            Manhwa.objects.filter(pk=manhwa.id).update(views_count=0)
+
+            with TemporaryDirectory() as buffer_dir, override_settings(VIEW_BUFFER_DIR=buffer_dir):
+                report(self.stdout, 'buffered', *run_threads(record_view, calls, options['threads']))
+                start = time.perf_counter()
+                flush_views(grace=0)
+                self.stdout.write(f'flush: {time.perf_counter() - start:.3f}s for {len(calls)} buffered views')
+            self.check_count(manhwa, len(users))
+
+    @staticmethod
+    def direct_view(user_id, manhwa_id):
+        # request path before view buffer
+        view_obj, created = View.objects.get_or_create(user_id=user_id, manhwa_id=manhwa_id)
+        if created:
+            Manhwa.objects.filter(pk=manhwa_id).update(views_count=F('views_count') + 1)
+
+    def check_count(self, manhwa, expected):
+        manhwa.refresh_from_db()
+        style = self.style.SUCCESS if manhwa.views_count == expected else self.style.ERROR
+        self.stdout.write(style(f'views_count: {manhwa.views_count} (expected {expected})'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from manhwas.cache import cache_metrics, reset_cache_metrics
+
+
+class Command(BaseCommand):
+    help = 'hits, misses & hit ratio of cached home grid and manhwa details (counted in the cache backend)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='set counters to zero after printing them')
+
+    def handle(self, *args, **options):
+        for kind, metrics in cache_metrics().items():
+            ratio = 'n/a' if metrics['hit_ratio'] is None else f'{metrics["hit_ratio"]:.1%}'
+            self.stdout.write(f'{kind:16} hits {metrics["hits"]}  misses {metrics["misses"]}  hit ratio {ratio}')
+
+        if options['reset']:
+            reset_cache_metrics()
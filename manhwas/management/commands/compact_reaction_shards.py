@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from manhwas.models import CommentReactionCounterShard
+
+
+class Command(BaseCommand):
+    help = 'merge comment reaction counter shards into likes_count & dis_likes_count of comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='comments whose shards are merged in each transaction')
+
+    def handle(self, *args, **options):
+        compacted = CommentReactionCounterShard.objects.compact(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{compacted} counter shards compacted.'))
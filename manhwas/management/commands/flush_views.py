@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from manhwas.view_buffer import flush_downloads, flush_views
+
+
+class Command(BaseCommand):
+    help = (
+        'save buffered manhwa views to db and increase views_count of manhwas in batches, '
+        'and add buffered episode downloads to downloads_count'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='views saved in each transaction')
+        parser.add_argument('--loop', action='store_true', help='run as worker, flush every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5, help='seconds between flushes of worker')
+
+    def handle(self, *args, **options):
+        while True:
+            created = flush_views(batch_size=options['batch_size'])
+            if created or not options['loop']:
+                self.stdout.write(f'{created} new views saved.')
+            downloads = flush_downloads(batch_size=options['batch_size'])
+            if downloads or not options['loop']:
+                self.stdout.write(f'{downloads} downloads counted.')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
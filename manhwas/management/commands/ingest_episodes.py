@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from manhwas.ingest import ingest_episodes
+from manhwas.models import Manhwa
+
+
+class Command(BaseCommand):
+    help = (
+        'add files of a directory or zip archive as next episodes of a manhwa, in natural order of file names. '
+        'run it again after an interruption: uploaded files and added episodes are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('manhwa_id', type=int)
+        parser.add_argument('source', help='directory or zip archive of episode files')
+
+    def handle(self, *args, **options):
+        try:
+            manhwa = Manhwa.objects.get(pk=options['manhwa_id'])
+        except Manhwa.DoesNotExist:
+            raise CommandError(f'manhwa {options["manhwa_id"]} not exist.')
+
+        def progress(index, count, name, uploaded):
+            self.stdout.write(f'[{index}/{count}] {name}{"" if uploaded else " (already uploaded)"}')
+
+        try:
+            result = ingest_episodes(manhwa, options['source'], progress=progress)
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        numbers = f' (episodes {result["first_number"]}-{result["last_number"]})' if result['created'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["files"]} files, {result["uploaded"]} uploaded, {result["created"]} episodes added{numbers}.'
+        ))
@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from manhwas.covers import pending_covers, process_covers, process_pool
+
+
+class Command(BaseCommand):
+    help = (
+        'make resized webp & jpeg variants (srcset) of new or changed manhwa covers in a pool of processes. '
+        'an interrupted run is continued by the next one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(), help='processes that resize covers, 0 resizes in this process'
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help='covers saved to db in each batch')
+        parser.add_argument('--loop', action='store_true', help='run as worker, check covers every --interval seconds')
+        parser.add_argument('--interval', type=float, default=10, help='seconds between checks of worker')
+
+    def handle(self, *args, **options):
+        total, failed = 0, set()
+        with process_pool(options['workers']) as executor:
+            while True:
+                processed = process_covers(executor, batch_size=options['batch_size'], failed=failed)
+                total += processed
+                if processed or pending_covers().exclude(id__in=failed).exists():
+                    if processed and options['loop']:
+                        self.stdout.write(f'{processed} covers processed.')
+                    continue
+
+                if not options['loop']:
+                    break
+                failed.clear()  # storage errors are retried after interval
+                time.sleep(options['interval'])
+
+        if failed:
+            self.stderr.write(f'{len(failed)} covers failed, they are retried by next run.')
+        self.stdout.write(self.style.SUCCESS(f'{total} covers processed.'))
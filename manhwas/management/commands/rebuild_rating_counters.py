@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from manhwas.cache import HOME_GRID, bump_version
+from manhwas.models import Rate
+
+
+class Command(BaseCommand):
+    help = 'rebuild stored rating counters (sum, count, histogram) of manhwas from rates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('manhwa_ids', nargs='*', type=int, help='only rebuild these manhwas')
+
+    def handle(self, *args, **options):
+        manhwa_ids = options['manhwa_ids'] or None
+        updated = Rate.objects.sync_manhwa_rating_counters(manhwa_ids)
+        bump_version(HOME_GRID)
+        self.stdout.write(self.style.SUCCESS(f'rating counters of {updated} manhwas rebuilt.'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from manhwas.cache import HOME_GRID, bump_version
+from manhwas.reconcile import reconcile_comment_reactions, reconcile_manhwa_views
+
+
+class Command(BaseCommand):
+    help = (
+        'recompute likes_count & dis_likes_count of comments and views_count of manhwas '
+        'with chunked set-based updates'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--manhwa-from', type=int, help='first manhwa id of range')
+        parser.add_argument('--manhwa-to', type=int, help='last manhwa id of range')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='ids updated in each statement')
+        parser.add_argument('--only', choices=['comments', 'views'], help='only reconcile these counters')
+        parser.add_argument('--dry-run', action='store_true', help='only report drifted counters')
+
+    def handle(self, *args, **options):
+        manhwa_from, manhwa_to = options['manhwa_from'], options['manhwa_to']
+        manhwa_range = None
+        if manhwa_from is not None or manhwa_to is not None:
+            manhwa_range = (manhwa_from or 0, manhwa_to if manhwa_to is not None else 2 ** 63 - 1)
+            if manhwa_range[0] > manhwa_range[1]:
+                raise CommandError('--manhwa-from is greater than --manhwa-to.')
+
+        kwargs = {'manhwa_range': manhwa_range, 'chunk_size': options['chunk_size'], 'dry_run': options['dry_run']}
+        only, dry_run = options['only'], options['dry_run']
+
+        if only in (None, 'comments'):
+            self.report('comments', reconcile_comment_reactions(**kwargs), dry_run)
+
+        if only in (None, 'views'):
+            result = reconcile_manhwa_views(**kwargs)
+            self.report('manhwas', result, dry_run)
+            if result['rows'] and not dry_run:
+                bump_version(HOME_GRID)
+
+    def report(self, name, result, dry_run):
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f'counters of {result["rows"]} {name} fixed.'))
+            return
+
+        drift = ', '.join(f'{col}: {total}' for col, total in result['drift'].items())
+        self.stdout.write(f'{result["rows"]} {name} drifted ({drift}).')
+        if result['samples']:
+            self.stdout.write(f'  e.g. ids: {", ".join(map(str, result["samples"]))}')
@@ -0,0 +1,223 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from itertools import islice
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import CustomUser
+from manhwas.cache import HOME_GRID, bump_version
+from manhwas.models import Comment, CommentReAction, Episode, Genre, Manhwa, N, Rate, Studio, View
+from manhwas.reconcile import reconcile_manhwa_views
+
+SEED_PHONE_PREFIX = '098'
+SEED_PASSWORD = 'seedpass1234'
+SEED_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def chunked(iterable, size):
+    """lists of size items from iterable, without loading all of it"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def popularity(count, total, cap):
+    """split total between count items with a long tail (first items are most popular), each at most cap"""
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(count)]
+    weights_sum = sum(weights)
+    return [min(cap, round(total * weight / weights_sum)) for weight in weights]
+
+
+class Command(BaseCommand):
+    help = (
+        'generate a large synthetic dataset for load testing: users, manhwas with episodes, rates, views, '
+        'comment trees (3 levels) and reactions. rows are created with bulk_create in chunks, '
+        'stored counters are filled, and the same seed generates the same data. '
+        f'users get phone numbers starting with {SEED_PHONE_PREFIX} and password {SEED_PASSWORD}. '
+        'another run adds a new dataset, numbers of its users continue after the last seeded user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50000)
+        parser.add_argument('--manhwas', type=int, default=2000)
+        parser.add_argument('--episodes', type=int, default=40, help='max episodes of each manhwa')
+        parser.add_argument('--rates', type=int, default=1000000)
+        parser.add_argument('--views', type=int, default=2000000)
+        parser.add_argument('--comments', type=int, default=300000, help='top level comments, replies are extra')
+        parser.add_argument('--reactions', type=int, default=3, help='average reactions of each comment')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows of each bulk insert')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rand = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+
+        user_ids = self.step('users', self.create_users, options['users'])
+        manhwa_ids = self.step('manhwas', self.create_manhwas, options['manhwas'], options['episodes'])
+        self.step('rates', self.create_pairs, Rate, manhwa_ids, user_ids, options['rates'])
+        self.step('views', self.create_pairs, View, manhwa_ids, user_ids, options['views'])
+        self.step('comments', self.create_comments, manhwa_ids, user_ids, options['comments'], options['reactions'])
+        self.step('counters', self.update_counters)
+        bump_version(HOME_GRID)
+
+    def step(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        count = len(result) if isinstance(result, list) else result
+        suffix = f': {count} rows' if count is not None else ''
+        self.stdout.write(f'{name}{suffix} in {time.perf_counter() - start:.1f}s')
+        return result
+
+    def create_users(self, count):
+        """returns: ids of users (only ints are kept in memory)"""
+        password = make_password(SEED_PASSWORD)  # hashed once, same for all users
+        # phone numbers & usernames are unique, users of a previous run are kept
+        last = CustomUser.objects.filter(phone_number__startswith=SEED_PHONE_PREFIX).aggregate(
+            last=Max('phone_number')
+        )['last']
+        first = int(last[len(SEED_PHONE_PREFIX):]) + 1 if last else 0
+        users = (
+            CustomUser(phone_number=f'{SEED_PHONE_PREFIX}{i:08d}', username=f'seed-user-{i}', password=password)
+            for i in range(first, first + count)
+        )
+        ids = []
+        for chunk in chunked(users, self.chunk_size):
+            ids += [user.id for user in CustomUser.objects.bulk_create(chunk)]
+        return ids
+
+    def create_cover(self, index):
+        """small generated cover of manhwa, kept between runs"""
+        name = f'Manhwa/seed/cover-{index}.jpg'
+        color = tuple(self.rand.randrange(256) for _ in range(3))
+        if not default_storage.exists(name):
+            image = Image.new('RGB', (200, 300), color)
+            image.paste(tuple(255 - c for c in color), (0, 200, 200, 240))
+            content = BytesIO()
+            image.save(content, format='JPEG', quality=80)
+            name = default_storage.save(name, ContentFile(content.getvalue()))
+        return name
+
+    def create_manhwas(self, count, max_episodes):
+        """create manhwas with genres & episodes, returns: ids of manhwas (most popular first)"""
+        studios = Studio.objects.bulk_create([
+            Studio(title=f'seed studio {i}', description='seed') for i in range(max(count // 40, 1))
+        ])
+        genres = Genre.objects.bulk_create([Genre(title=f'seed genre {i}', description='seed') for i in range(12)])
+        days = [day for day, _ in Manhwa.DAY_OF_THE_WEEK]
+
+        ids = []
+        for chunk in chunked(range(count), self.chunk_size):
+            manhwas, episodes = [], []
+            for i in chunk:
+                episodes_count = self.rand.randint(1, max_episodes)
+                season = self.rand.randint(1, 3)
+                manhwas.append(Manhwa(
+                    en_title=f'seed manhwa {i}', summary=f'summary of seed manhwa {i}', season=season,
+                    day_of_week=self.rand.choice(days), cover=self.create_cover(i),
+                    publication_datetime=SEED_EPOCH + timedelta(minutes=self.rand.randrange(3 * 365 * 24 * 60)),
+                    studio=self.rand.choice(studios), last_upload=f'S{N(season)}-E{N(episodes_count)}',
+                    next_episode_number=episodes_count + 1,
+                ))
+                episodes.append(episodes_count)
+            manhwas = Manhwa.objects.bulk_create(manhwas)
+
+            Manhwa.genres.through.objects.bulk_create([
+                Manhwa.genres.through(manhwa_id=manhwa.id, genre_id=genre.id)
+                for manhwa in manhwas for genre in self.rand.sample(genres, self.rand.randint(1, 3))
+            ])
+            Episode.objects.bulk_create((
+                Episode(manhwa_id=manhwa.id, number=number, file=f'Manhwa/seed/episode-{number}.pdf')
+                for manhwa, episodes_count in zip(manhwas, episodes) for number in range(1, episodes_count + 1)
+            ), batch_size=self.chunk_size)
+            ids += [manhwa.id for manhwa in manhwas]
+        return ids
+
+    def create_pairs(self, model, manhwa_ids, user_ids, total):
+        """create rates or views (one per user & manhwa) spread by popularity of manhwas"""
+        def rows():
+            for manhwa_id, count in zip(manhwa_ids, popularity(len(manhwa_ids), total, len(user_ids))):
+                for user_id in self.rand.sample(user_ids, count):
+                    if model is Rate:
+                        yield Rate(manhwa_id=manhwa_id, user_id=user_id, rating=self.rand.choices(
+                            (1, 2, 3, 4, 5), weights=(1, 1, 2, 4, 4))[0])
+                    else:
+                        yield View(manhwa_id=manhwa_id, user_id=user_id)
+
+        created = 0
+        for chunk in chunked(rows(), self.chunk_size):
+            created += len(model.objects.bulk_create(chunk))
+        return created
+
+    def reactions_of(self, user_ids, average):
+        """(user_id, reaction) of a comment, mostly likes"""
+        count = min(self.rand.randint(0, 2 * average), len(user_ids))
+        return [
+            (user_id, CommentReAction.LIKE if self.rand.random() < 0.8 else CommentReAction.DISLIKE)
+            for user_id in self.rand.sample(user_ids, count)
+        ]
+
+    def create_level(self, planned, level):
+        """
+        create comments of one level and their reactions.
+        planned: list of (comment fields, reactions, children count)
+        returns: created comments with their children count, in same order
+        """
+        comments = []
+        for fields, reactions, children in planned:
+            likes = sum(reaction == CommentReAction.LIKE for _, reaction in reactions)
+            comments.append(Comment(
+                **fields, level=level, replies_count=children,
+                likes_count=likes, dis_likes_count=len(reactions) - likes,
+            ))
+        comments = Comment.objects.bulk_create(comments)
+
+        CommentReAction.objects.bulk_create((
+            CommentReAction(comment_id=comment.id, user_id=user_id, reaction=reaction)
+            for comment, (_, reactions, _) in zip(comments, planned) for user_id, reaction in reactions
+        ), batch_size=self.chunk_size)
+        return [(comment, children) for comment, (_, _, children) in zip(comments, planned)]
+
+    def create_comments(self, manhwa_ids, user_ids, total, reactions):
+        """create comment trees: top level comments with 0-3 replies, each reply with 0-2 replies"""
+        def top_level():
+            for manhwa_id, count in zip(manhwa_ids, popularity(len(manhwa_ids), total, total)):
+                for i in range(count):
+                    yield manhwa_id, i
+
+        created = 0
+        max_children = {0: 3, 1: 2, 2: 0, 3: 0}
+        for chunk in chunked(top_level(), self.chunk_size):
+            planned = [
+                ({'manhwa_id': manhwa_id, 'author_id': self.rand.choice(user_ids), 'text': f'seed comment {i}'},
+                 self.reactions_of(user_ids, reactions), self.rand.randint(0, max_children[0]))
+                for manhwa_id, i in chunk
+            ]
+            for level in range(3):
+                parents = self.create_level(planned, level)
+                created += len(parents)
+                planned = [
+                    ({'manhwa_id': parent.manhwa_id, 'parent_id': parent.id, 'author_id': self.rand.choice(user_ids),
+                      'text': f'seed reply {parent.id}-{i}'},
+                     self.reactions_of(user_ids, reactions), self.rand.randint(0, max_children[level + 1]))
+                    for parent, children in parents for i in range(children)
+                ]
+                if not planned:
+                    break
+        return created
+
+    def update_counters(self):
+        """counters that are set-based on whole tables"""
+        Rate.objects.sync_manhwa_rating_counters()
+        reconcile_manhwa_views()
+        comments = Comment.objects.filter(manhwa_id=OuterRef('pk')).values('manhwa_id').annotate(
+            count=Count('id')
+        ).values('count')
+        Manhwa.objects.update(comments_count=Coalesce(Subquery(comments), Value(0)))
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_counters(apps, schema_editor):
+    Manhwa = apps.get_model('manhwas', 'Manhwa')
+    Rate = apps.get_model('manhwas', 'Rate')
+
+    def rates_subquery(aggregate, **filters):
+        query = Rate.objects.filter(manhwa_id=OuterRef('pk'), **filters).values('manhwa_id').annotate(
+            value=aggregate
+        ).values('value')
+        return Coalesce(Subquery(query), Value(0))
+
+    Manhwa.objects.update(
+        rating_sum=rates_subquery(Sum('rating')),
+        raters_count=rates_subquery(Count('id')),
+        fives_count=rates_subquery(Count('id'), rating=5),
+        fours_count=rates_subquery(Count('id'), rating=4),
+        threes_count=rates_subquery(Count('id'), rating=3),
+        twos_count=rates_subquery(Count('id'), rating=2),
+        ones_count=rates_subquery(Count('id'), rating=1),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0023_comment_manhwas_com_level_eea417_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manhwa',
+            name='fives_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='fours_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='ones_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='raters_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='raters count'),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='rating sum'),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='threes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='twos_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:04
+
+from django.db import migrations, models
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_avg_rating(apps, schema_editor):
+    Manhwa = apps.get_model('manhwas', 'Manhwa')
+    Manhwa.objects.update(
+        avg_rating=Coalesce(Cast(F('rating_sum'), FloatField()) / NullIf(F('raters_count'), Value(0)), Value(0.0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0024_manhwa_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manhwa',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False, verbose_name='average rating'),
+        ),
+        migrations.AddIndex(
+            model_name='manhwa',
+            index=models.Index(fields=['-avg_rating', '-id'], name='manhwas_man_avg_rat_a39322_idx'),
+        ),
+        migrations.RunPython(fill_avg_rating, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:08
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comments_count(apps, schema_editor):
+    Manhwa = apps.get_model('manhwas', 'Manhwa')
+    Comment = apps.get_model('manhwas', 'Comment')
+    comments = Comment.objects.filter(manhwa_id=OuterRef('pk')).values('manhwa_id').annotate(
+        count=Count('id')
+    ).values('count')
+    Manhwa.objects.update(comments_count=Coalesce(Subquery(comments), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0025_manhwa_avg_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manhwa',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comments count'),
+        ),
+        migrations.RunPython(fill_comments_count, migrations.RunPython.noop),
+    ]
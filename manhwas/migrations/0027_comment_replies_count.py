@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_replies_count(apps, schema_editor):
+    Comment = apps.get_model('manhwas', 'Comment')
+    replies = Comment.objects.filter(parent_id=OuterRef('pk')).values('parent_id').annotate(
+        count=Count('id')
+    ).values('count')
+    Comment.objects.update(replies_count=Coalesce(Subquery(replies), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0026_manhwa_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_replies_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0027_comment_replies_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentReactionCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('likes', models.IntegerField(default=0)),
+                ('dis_likes', models.IntegerField(default=0)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='manhwas.comment')),
+            ],
+            options={
+                'unique_together': {('comment', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:30
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_next_episode_number(apps, schema_editor):
+    Manhwa = apps.get_model('manhwas', 'Manhwa')
+    Episode = apps.get_model('manhwas', 'Episode')
+    last_numbers = Episode.objects.filter(manhwa_id=OuterRef('pk')).values('manhwa_id').annotate(
+        last=Max('number')
+    ).values('last')
+    Manhwa.objects.update(next_episode_number=Coalesce(Subquery(last_numbers), Value(0)) + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0028_commentreactioncountershard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manhwa',
+            name='next_episode_number',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(fill_next_episode_number, migrations.RunPython.noop),
+    ]
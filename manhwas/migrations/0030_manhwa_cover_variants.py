@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0029_manhwa_next_episode_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manhwa',
+            name='cover_variants',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='cover_variants_source',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+    ]
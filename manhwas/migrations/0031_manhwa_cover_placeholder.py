@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0030_manhwa_cover_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manhwa',
+            name='cover_placeholder',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='manhwa',
+            name='cover_color',
+            field=models.CharField(blank=True, editable=False, max_length=7),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0031_manhwa_cover_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='file_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['manhwa', 'file_hash'], name='manhwas_epi_manhwa__71732a_idx'),
+        ),
+    ]
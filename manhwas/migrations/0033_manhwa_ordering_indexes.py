@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manhwas', '0032_episode_file_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='manhwa',
+            name='manhwas_man_publica_1bafff_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='manhwa',
+            name='manhwas_man_views_c_c4cd75_idx',
+        ),
+        migrations.AddIndex(
+            model_name='manhwa',
+            index=models.Index(fields=['-publication_datetime', '-id'], name='manhwas_man_publica_e6f2c4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manhwa',
+            index=models.Index(fields=['-views_count', '-id'], name='manhwas_man_views_c_7a989d_idx'),
+        ),
+    ]
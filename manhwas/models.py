@@ -1,14 +1,20 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models, transaction
-from django.db.models import F, Avg, Count, Case, When
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import F, Count, Case, When, Sum, Subquery, OuterRef, Value, FloatField
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import gettext as _
 from django_ckeditor_5.fields import CKEditor5Field
+from PIL import Image
 
-from config import settings
+from .placeholders import image_placeholder
 
 import os.path
+import random
 
 
 def N(number) -> str:
@@ -17,6 +23,18 @@ def N(number) -> str:
     return f'0{number}' if number < 10 else str(number)
 
 
+# value of a field that was deferred when the row was loaded
+NOT_LOADED = object()
+
+
+def avg_rating_expression(rating_sum, raters_count):
+    # rating_sum / raters_count, 0 when no one rated
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / NullIf(raters_count, Value(0)),
+        Value(0.0)
+    )
+
+
 def manhwa_file_upload_to(instance, filename):
     # استفاده از slugify برای تمیز کردن عنوان و جلوگیری از مشکلات مسیر
     manhwa_title = instance.manhwa.en_title
@@ -36,6 +54,13 @@ def manhwa_cover_upload_to(instance, filename):
     return os.path.join('Manhwa', slugify(manhwa_title), slugify("Season " + season), 'Covers', filename)
 
 
+def manhwa_cover_variant_name(cover_name, width, image_format):
+    directory, filename = os.path.split(cover_name)
+
+    # manhwas/title/season/covers/variants/filename-width.format
+    return os.path.join(directory, 'variants', f'{os.path.splitext(filename)[0]}-{width}w.{image_format}')
+
+
 class Genre(models.Model):
     title = models.CharField(max_length=200, verbose_name=_('title'))
     description = models.CharField(max_length=500, verbose_name='description')
@@ -64,6 +89,17 @@ class Manhwa(models.Model):
         ('all', 'All people'), ('adult', 'older than 18'),
         ('child', 'less than 13'), ('teen', 'older than 13'),
     )
+    # rating -> histogram counter field
+    RATING_COUNT_FIELDS = {
+        5: 'fives_count', 4: 'fours_count', 3: 'threes_count',
+        2: 'twos_count', 1: 'ones_count',
+    }
+    # fields kept by set-based updates, a plain save of a loaded manhwa doesn't write them back
+    # (it would revert updates made since it was loaded)
+    MANAGED_FIELDS = frozenset({
+        'views_count', 'comments_count', 'rating_sum', 'raters_count', 'avg_rating', *RATING_COUNT_FIELDS.values(),
+        'next_episode_number', 'last_upload', 'cover_variants', 'cover_variants_source',
+    })
 
     fa_title = models.CharField(max_length=500, blank=True, verbose_name=_('persian title'))
     en_title = models.CharField(max_length=500, verbose_name=_('english title'))
@@ -71,11 +107,30 @@ class Manhwa(models.Model):
     season = models.PositiveIntegerField(default=1, verbose_name=_('season'))
     day_of_week = models.CharField(max_length=30, choices=DAY_OF_THE_WEEK, verbose_name=_('day of the week'))
     cover = models.ImageField(upload_to=manhwa_cover_upload_to, verbose_name=_('manhwa cover'))
+    # resized copies of cover {format: [widths]}, made by process_covers from cover named cover_variants_source
+    cover_variants = models.JSONField(default=dict, editable=False)
+    cover_variants_source = models.CharField(max_length=100, blank=True, editable=False)
+    # tiny data uri of cover & its dominant color (#rrggbb), painted before cover is loaded
+    cover_placeholder = models.TextField(blank=True, editable=False)
+    cover_color = models.CharField(max_length=7, blank=True, editable=False)
     publication_datetime = models.DateTimeField(verbose_name=_('publication datetime'))
     genres = models.ManyToManyField(Genre, related_name='manhwas', verbose_name=_('genre'))
     studio = models.ForeignKey(Studio, on_delete=models.PROTECT, related_name='manhwas', verbose_name=_('studio'))
     views_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('views count'))
     last_upload = models.CharField(default='Not Uploaded', editable=False)
+    # number of next uploaded episode, reserved by EpisodeManager.reserve_numbers
+    next_episode_number = models.PositiveIntegerField(default=1, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments count'))
+
+    # rating counters, kept by Rate.save & the post_delete signal of Rate
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('rating sum'))
+    raters_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('raters count'))
+    fives_count = models.PositiveIntegerField(default=0, editable=False)
+    fours_count = models.PositiveIntegerField(default=0, editable=False)
+    threes_count = models.PositiveIntegerField(default=0, editable=False)
+    twos_count = models.PositiveIntegerField(default=0, editable=False)
+    ones_count = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.FloatField(default=0, editable=False, verbose_name=_('average rating'))
 
     datetime_created = models.DateTimeField(auto_now_add=True, verbose_name=_('datetime created'))
     datetime_modified = models.DateTimeField(auto_now=True, verbose_name=_('datetime modified'))
@@ -88,26 +143,116 @@ class Manhwa(models.Model):
             models.Index(fields=['datetime_created', 'datetime_modified']),
             models.Index(fields=['studio', 'day_of_week']),
             models.Index(fields=['day_of_week']),
-            models.Index(fields=['-publication_datetime']),
-            models.Index(fields=['-views_count']),
+            models.Index(fields=['-publication_datetime', '-id']),
+            models.Index(fields=['-views_count', '-id']),
             models.Index(fields=['en_title']),
+            models.Index(fields=['-avg_rating', '-id']),
         )
 
     def __str__(self):
         return self.en_title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = {
+                field.attname for field in self._meta.concrete_fields if not field.primary_key
+            } - self.MANAGED_FIELDS - self.get_deferred_fields()
+
+        # placeholder of old cover is not kept, a cover cleared or set to a stored file gets none
+        uploaded = self.cover and not self.cover._committed
+        cover_name = self.cover.name or ''
+        old_cover = cover_name if self._state.adding else getattr(self, '_loaded_cover', NOT_LOADED)
+        if uploaded or old_cover not in (NOT_LOADED, cover_name):
+            self.cover_placeholder, self.cover_color = '', ''
+            if uploaded:
+                try:
+                    self.cover_placeholder, self.cover_color = image_placeholder(self.cover.file)
+                except (OSError, Image.DecompressionBombError):  # not an image, cards keep their background
+                    pass
+                finally:
+                    self.cover.file.seek(0)
+
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'cover_placeholder', 'cover_color'}
+        super().save(*args, **kwargs)
+        self._loaded_cover = self.cover.name or ''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_cover = instance.__dict__.get('cover', NOT_LOADED)  # to find cover changes in save
+        return instance
+
+    @property
+    def cover_srcsets(self):
+        """{format: srcset} of resized covers, best format first. empty until variants of current cover are made"""
+        if not self.cover or self.cover_variants_source != self.cover.name:
+            return {}
+        storage = self.cover.storage
+        return {
+            image_format: ', '.join(
+                f'{storage.url(manhwa_cover_variant_name(self.cover.name, width, image_format))} {width}w'
+                for width in widths
+            )
+            for image_format, widths in self.cover_variants.items()
+        }
+
     @property
     def rating_data(self):
-        query_set = self.rates.aggregate(
-            avg_rating=Avg('rating'),
-            raters_count=Count('id'),
-            fives_count=Count(Case(When(rating=5, then=1))),
-            fours_count=Count(Case(When(rating=4, then=1))),
-            threes_count=Count(Case(When(rating=3, then=1))),
-            twos_count=Count(Case(When(rating=2, then=1))),
-            ones_count=Count(Case(When(rating=1, then=1)))
-        )
-        return query_set
+        """rating summary from stored counters, without any query"""
+        return {
+            'avg_rating': self.avg_rating if self.raters_count else None,
+            'raters_count': self.raters_count,
+            **{field: getattr(self, field) for field in self.RATING_COUNT_FIELDS.values()},
+        }
+
+    @property
+    def rating_histogram(self):
+        """(rating, count of rates) from 5 to 1, from stored counters"""
+        return [(rating, getattr(self, field)) for rating, field in self.RATING_COUNT_FIELDS.items()]
+
+
+class ViewManager(models.Manager):
+    def add_views(self, pairs):
+        """
+        create views of (user_id, manhwa_id) pairs that not exist and increase views_count of their manhwas.
+        duplicate pairs and views of deleted users or manhwas are ignored.
+
+        returns: count of created views
+        """
+        users_of_manhwa = {}
+        for user_id, manhwa_id in pairs:
+            users_of_manhwa.setdefault(manhwa_id, set()).add(user_id)
+
+        all_users = set().union(*users_of_manhwa.values())
+        user_ids = set(get_user_model().objects.filter(pk__in=all_users).values_list('pk', flat=True))
+        manhwa_ids = Manhwa.objects.filter(pk__in=users_of_manhwa).values_list('pk', flat=True)
+
+        new_views = []
+        increments = {}
+        with transaction.atomic():
+            manhwa_ids = list(manhwa_ids)
+            existing = set(
+                self.filter(manhwa_id__in=manhwa_ids, user_id__in=user_ids).values_list('manhwa_id', 'user_id')
+            )
+            for manhwa_id in manhwa_ids:
+                users = {
+                    user_id for user_id in users_of_manhwa[manhwa_id] & user_ids
+                    if (manhwa_id, user_id) not in existing
+                }
+                if users:
+                    new_views += [self.model(user_id=user_id, manhwa_id=manhwa_id) for user_id in users]
+                    increments[manhwa_id] = len(users)
+
+            if increments:
+                self.bulk_create(new_views, ignore_conflicts=True)
+                # one UPDATE for all manhwas of batch
+                Manhwa.objects.filter(pk__in=increments).update(views_count=F('views_count') + Case(
+                    *[When(pk=manhwa_id, then=Value(count)) for manhwa_id, count in increments.items()],
+                    default=Value(0)
+                ))
+
+        return len(new_views)
 
 
 class View(models.Model):
@@ -120,6 +265,8 @@ class View(models.Model):
     manhwa = models.ForeignKey(Manhwa, on_delete=models.CASCADE, related_name='views', verbose_name=_('manhwa'))
     datetime_viewed = models.DateTimeField(auto_now_add=True, verbose_name=_('datetime viewed'))
 
+    objects = ViewManager()
+
     class Meta:
         unique_together = ('manhwa', 'user')
 
@@ -127,6 +274,89 @@ class View(models.Model):
         return f'user: {self.user.phone_number} manhwa: {self.manhwa.en_title}'
 
 
+class RateManager(models.Manager):
+    def set_rating(self, user, manhwa_id, rating):
+        """
+        create or update rate of user on manhwa and keep rating counters of manhwa.
+
+        returns: (rate_obj, created)
+        """
+        with transaction.atomic():
+            try:
+                rate_obj = self.select_for_update().get(user=user, manhwa_id=manhwa_id)  # lock update row
+                old_rating = rate_obj.rating
+
+                if old_rating != rating:
+                    rate_obj.rating = rating
+                    rate_obj.save(update_fields=['rating'])  # counters are kept by Rate.save
+                created = False
+
+            except self.model.DoesNotExist:
+                rate_obj = self.create(user=user, manhwa_id=manhwa_id, rating=rating)
+                created = True
+
+            return rate_obj, created
+
+    def _update_manhwa_rating_counters(self, manhwa_id, old_rating=None, new_rating=None):
+        """
+        update rating_sum, raters_count and histogram counters of manhwa.
+        if rate is deleted, new_rating must be None!
+        if rate created, old_rating must be None!
+        and if rating changed, you must set both old_rating & new_rating
+        """
+        updates = {}
+        rating_sum = F('rating_sum')
+        raters_count = F('raters_count')
+
+        if old_rating is not None:
+            field = Manhwa.RATING_COUNT_FIELDS[old_rating]
+            updates[field] = F(field) - 1
+            rating_sum = rating_sum - old_rating
+
+        if new_rating is not None:
+            field = Manhwa.RATING_COUNT_FIELDS[new_rating]
+            updates[field] = F(field) + 1
+            rating_sum = rating_sum + new_rating
+
+        if old_rating is None and new_rating is not None:
+            raters_count = raters_count + 1
+        elif old_rating is not None and new_rating is None:
+            raters_count = raters_count - 1
+
+        if updates:
+            Manhwa.objects.filter(pk=manhwa_id).update(
+                rating_sum=rating_sum,
+                raters_count=raters_count,
+                avg_rating=avg_rating_expression(rating_sum, raters_count),
+                **updates
+            )
+
+    def sync_manhwa_rating_counters(self, manhwa_ids=None):
+        """rebuild rating counters of manhwas (all manhwas if manhwa_ids is None) from real rates"""
+
+        def rates_subquery(aggregate, **filters):
+            query = self.filter(manhwa_id=OuterRef('pk'), **filters).values('manhwa_id').annotate(
+                value=aggregate
+            ).values('value')
+            return Coalesce(Subquery(query), Value(0))
+
+        updates = {
+            'rating_sum': rates_subquery(Sum('rating')),
+            'raters_count': rates_subquery(Count('id')),
+        }
+        for rating, field in Manhwa.RATING_COUNT_FIELDS.items():
+            updates[field] = rates_subquery(Count('id'), rating=rating)
+
+        manhwas = Manhwa.objects.all()
+        if manhwa_ids is not None:
+            manhwas = manhwas.filter(pk__in=manhwa_ids)
+
+        with transaction.atomic():
+            updated = manhwas.update(**updates)
+            manhwas.update(avg_rating=avg_rating_expression(F('rating_sum'), F('raters_count')))
+        return updated
+
+
 class Rate(models.Model):
     RATING_CHOICES = (
         (1, '1'), (2, '2'), (3, '3'),
@@ -141,48 +371,149 @@ class Rate(models.Model):
     manhwa = models.ForeignKey(Manhwa, on_delete=models.CASCADE, related_name='rates', verbose_name=_('manhwa'))
     rating = models.PositiveSmallIntegerField(choices=RATING_CHOICES, verbose_name=_('rating'))
 
+    objects = RateManager()
+
     class Meta:
         unique_together = ('user', 'manhwa')
 
+    def save(self, *args, **kwargs):
+        """keep rating counters of manhwa on every save (set_rating, admin, shell)"""
+        old = None if self._state.adding else getattr(self, '_loaded_rating', NOT_LOADED)
+        with transaction.atomic(savepoint=False):
+            if old is NOT_LOADED:  # manhwa or rating was deferred
+                old = Rate.objects.filter(pk=self.pk).values_list('manhwa_id', 'rating').first()
+            super().save(*args, **kwargs)
+
+            if old is not None and old[0] == self.manhwa_id:
+                if old[1] != self.rating:
+                    Rate.objects._update_manhwa_rating_counters(
+                        self.manhwa_id, old_rating=old[1], new_rating=self.rating
+                    )
+            else:  # new rate or moved to another manhwa
+                if old is not None:
+                    Rate.objects._update_manhwa_rating_counters(old[0], old_rating=old[1])
+                Rate.objects._update_manhwa_rating_counters(self.manhwa_id, new_rating=self.rating)
+        self._loaded_rating = (self.manhwa_id, self.rating)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = (instance.__dict__.get('manhwa_id', NOT_LOADED), instance.__dict__.get('rating', NOT_LOADED))
+        instance._loaded_rating = NOT_LOADED if NOT_LOADED in loaded else loaded  # to find changes in save
+        return instance
+
+
+def supports_update_returning():
+    """UPDATE ... RETURNING on current connection: postgresql & sqlite 3.35+ (not mysql or mariadb)"""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _padded_sql(expression):
+    # N() of sql integer expression
+    return f"CASE WHEN {expression} < 10 THEN '0' || CAST({expression} AS TEXT) ELSE CAST({expression} AS TEXT) END"
+
+
+class EpisodeManager(models.Manager):
+    def reserve_numbers(self, manhwa_id, count=1):
+        """
+        reserve next count episode numbers of manhwa and set last_upload of manhwa to the last one,
+        in one UPDATE ... RETURNING (the row lock of update orders concurrent uploads).
+        call it in the transaction that inserts the episodes, so numbers of a failed insert are not lost.
+
+        returns: first reserved number
+        raises: Manhwa.DoesNotExist
+        """
+        if supports_update_returning():
+            last = '(next_episode_number + %(count)s - 1)'
+            sql = f"""
+                UPDATE {Manhwa._meta.db_table}
+                SET next_episode_number = next_episode_number + %(count)s,
+                    last_upload = 'S' || {_padded_sql('season')} || '-E' || {_padded_sql(last)},
+                    datetime_modified = %(now)s
+                WHERE id = %(manhwa_id)s
+                RETURNING next_episode_number - %(count)s
+            """
+            with connection.cursor() as cursor:
+                cursor.execute(sql, {'count': count, 'now': timezone.now(), 'manhwa_id': manhwa_id})
+                row = cursor.fetchone()
+            if row is None:
+                raise Manhwa.DoesNotExist
+            return row[0]
+
+        with transaction.atomic():
+            manhwa = Manhwa.objects.select_for_update().only('season', 'next_episode_number').get(pk=manhwa_id)
+            first = manhwa.next_episode_number
+            Manhwa.objects.filter(pk=manhwa_id).update(
+                next_episode_number=first + count,
+                last_upload=f'S{N(manhwa.season)}-E{N(first + count - 1)}',
+                datetime_modified=timezone.now(),
+            )
+            return first
+
+    def add_downloads(self, counts):
+        """add counts {episode_id: downloads} to downloads_count of episodes in one UPDATE"""
+        self.filter(pk__in=counts).update(downloads_count=F('downloads_count') + Case(
+            *[When(pk=episode_id, then=Value(count)) for episode_id, count in counts.items()],
+            default=Value(0)
+        ))
+
 
 class Episode(models.Model):
     manhwa = models.ForeignKey(Manhwa, on_delete=models.PROTECT, related_name='episodes', verbose_name=_('manhwas'))
     number = models.PositiveIntegerField(blank=True, editable=False, verbose_name=_('number of episode'))
     file = models.FileField(upload_to=manhwa_file_upload_to, verbose_name=_('episode file'))
     downloads_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('download count'))
+    # sha256 of file content, set by ingest_episodes so a file is not added twice
+    file_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     datetime_created = models.DateTimeField(auto_now_add=True, verbose_name=_('datetime created'))
     datetime_modified = models.DateTimeField(auto_now=True, verbose_name=_('datetime modified'))
 
+    objects = EpisodeManager()
+
     class Meta:
         unique_together = ('number', 'manhwa')
         ordering = ('number',)
         indexes = (
             models.Index(fields=['manhwa', 'number']),
+            models.Index(fields=['manhwa', 'file_hash']),
             models.Index(fields=['-downloads_count']),
             models.Index(fields=['-datetime_created']),
         )
-        
-    def save(self, *args, **kwargs):
-        last_episode = self.__class__.objects.filter(
-            manhwa_id=self.manhwa_id
-        ).order_by('-datetime_created').values('number').first()
-        self.number = 1 if last_episode is None else last_episode.get('number') + 1
 
-        self.update_last_episode_on_manhwa(self.number)
-
-        super().save(*args, **kwargs)
+    def save(self, *args, **kwargs):
+        # number is given only on insert, edits keep it
+        if not self._state.adding or self.number is not None:
+            return super().save(*args, **kwargs)
 
-    def update_last_episode_on_manhwa(self, number):
-        manhwa = Manhwa.objects.get(pk=self.manhwa_id)
-        season, episode = N(manhwa.season), N(number)
-        last_upload = f'S{season}-E{episode}'
-        Manhwa.objects.filter(pk=self.manhwa_id).update(last_upload=last_upload)
+        with transaction.atomic():
+            self.number = Episode.objects.reserve_numbers(self.manhwa_id)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.manhwa.en_title}: {self.number}'
 
 
+class CommentQuerySet(models.QuerySet):
+    def with_reaction_counts(self):
+        """
+        annotate likes & dis_likes deltas of counter shards that are not compacted yet.
+        current counts are Comment.current_likes_count & current_dis_likes_count.
+        """
+        if not settings.COMMENT_REACTION_COUNTER_SHARDS:
+            return self
+
+        def shards_sum(field):
+            query = CommentReactionCounterShard.objects.filter(comment_id=OuterRef('pk')).values('comment_id').annotate(
+                value=Sum(field)
+            ).values('value')
+            return Coalesce(Subquery(query), Value(0))
+
+        return self.annotate(likes_delta=shards_sum('likes'), dis_likes_delta=shards_sum('dis_likes'))
+
+
 class Comment(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -197,10 +528,13 @@ class Comment(models.Model):
 
     likes_count = models.PositiveIntegerField(default=0, editable=False)
     dis_likes_count = models.PositiveIntegerField(default=0, editable=False)
+    replies_count = models.PositiveIntegerField(default=0, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         unique_together = ('manhwa', 'author', 'text')  # try except for same text and spam robot
         ordering = ('-created_at',)
@@ -221,8 +555,37 @@ class Comment(models.Model):
             if self.level >= 3:
                 raise ValidationError('depth of comment cant more than 3.')
 
+        old_parent_id = None if self._state.adding else getattr(self, '_loaded_parent_id', self.parent_id)
         super().save(*args, **kwargs)
 
+        # parent_id not loaded (deferred): its change is not known, so replies counts are kept
+        if old_parent_id is not NOT_LOADED and old_parent_id != self.parent_id:  # new reply or parent changed
+            self._update_replies_count(old_parent_id, -1)
+            self._update_replies_count(self.parent_id, 1)
+        self._loaded_parent_id = self.parent_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id', NOT_LOADED)  # to find parent changes in save
+        return instance
+
+    @classmethod
+    def _update_replies_count(cls, comment_id, amount):
+        if comment_id is not None:
+            cls.objects.filter(pk=comment_id).update(replies_count=F('replies_count') + amount)
+
+    @property
+    def current_likes_count(self):
+        return self.likes_count + getattr(self, 'likes_delta', 0)
+
+    @property
+    def current_dis_likes_count(self):
+        return self.dis_likes_count + getattr(self, 'dis_likes_delta', 0)
+
+    def reaction_counts(self):
+        return {'likes_count': self.current_likes_count, 'dis_likes_count': self.current_dis_likes_count}
+
     def __str__(self):
         return f'{self.id}'
 
@@ -237,67 +600,195 @@ class CommentReactionManager(models.Manager):
         returns: (reaction_obj, action)
         action may be: 'updated', 'deleted', 'created'
         """
+        reaction_obj, action, _ = self.toggle_reaction_counts(user, comment_id, reaction)
+        return reaction_obj, action
+
+    def toggle_reaction_counts(self, user, comment_id, reaction, manhwa_id=None):
+        """
+        toggle reaction like toggle_reaction, and return new counters of comment.
+        existing of comment (in manhwa, if manhwa_id passed) is checked by the counters update itself,
+        so there is no read of comment before or after toggle.
+        raises Comment.DoesNotExist if comment not exist.
+
+        returns: (reaction_obj, action, {likes_count, dis_likes_count})
+        """
         with transaction.atomic():
-            try:
-                reaction_obj = self.select_for_update().get(  # lock update row
-                    user=user,
-                    comment_id=comment_id
-                )
-                old_reaction = reaction_obj.reaction
+            reaction_obj = self.select_for_update().filter(  # lock update row
+                user=user,
+                comment_id=comment_id
+            ).first()
+            old_reaction = reaction_obj.reaction if reaction_obj else None
+            new_reaction = None if old_reaction == reaction else reaction  # same reaction is unlike or undislike
+
+            counts = self._update_comment_reaction_counters(comment_id, old_reaction, new_reaction, manhwa_id)
+            if counts is None:
+                raise Comment.DoesNotExist('comment not found')
+
+            if reaction_obj is None:
+                reaction_obj = self.create(user=user, comment_id=comment_id, reaction=reaction)
+                action = 'created'
 
-                if reaction_obj.reaction == reaction:  # unlike or undislike
-                    reaction_obj.delete()
-                    self._update_comment_reaction_counters(comment_id, old_reaction=old_reaction)
-                    reaction_obj = None
-                    action = 'deleted'
+            elif new_reaction is None:
+                reaction_obj.delete()
+                reaction_obj = None
+                action = 'deleted'
+
+            else:
+                reaction_obj.reaction = new_reaction  # change reaction
+                reaction_obj.save(update_fields=['reaction'])
+                action = 'updated'
+
+        return reaction_obj, action, counts
+
+    def toggle_reactions(self, user, pairs):
+        """
+        apply many (comment_id, reaction) toggles of user in one transaction, in order of pairs.
+        only final reaction of each comment is written, with one counter update for all comments.
+        pairs of not existing comments are skipped.
+
+        returns: {comment_id: final reaction or None} of existing comments
+        """
+        comment_ids = set(
+            Comment.objects.filter(pk__in={comment_id for comment_id, _ in pairs}).values_list('pk', flat=True)
+        )
 
+        with transaction.atomic():
+            existing = {
+                obj.comment_id: obj for obj in
+                self.select_for_update().filter(user=user, comment_id__in=comment_ids)  # lock update rows
+            }
+            final = {comment_id: obj.reaction for comment_id, obj in existing.items()}
+            for comment_id, reaction in pairs:
+                if comment_id in comment_ids:
+                    final[comment_id] = None if final.get(comment_id) == reaction else reaction
+
+            to_delete, to_create, to_update = [], [], {}
+            deltas = {}
+            for comment_id, reaction in final.items():
+                reaction_obj = existing.get(comment_id)
+                old_reaction = reaction_obj.reaction if reaction_obj else None
+                if old_reaction == reaction:
+                    continue
+
+                if reaction is None:
+                    to_delete.append(reaction_obj.pk)
+                elif reaction_obj is None:
+                    to_create.append(self.model(user=user, comment_id=comment_id, reaction=reaction))
                 else:
-                    reaction_obj.reaction = reaction  # change reaction
-                    reaction_obj.save(update_fields=['reaction'])
-                    self._update_comment_reaction_counters(comment_id, old_reaction=old_reaction, new_reaction=reaction)
-                    action = 'updated'
+                    to_update.setdefault(reaction, []).append(reaction_obj.pk)
+                deltas[comment_id] = self._reaction_deltas(old_reaction, reaction)
 
-            except self.model.DoesNotExist:
-                reaction_obj = self.create(
-                    user=user,
-                    comment_id=comment_id,
-                    reaction=reaction
-                )
-                self._update_comment_reaction_counters(comment_id, new_reaction=reaction)
-                action = 'created'
+            if to_delete:
+                self.filter(pk__in=to_delete).delete()
+            for reaction, pks in to_update.items():
+                self.filter(pk__in=pks).update(reaction=reaction)
+            if to_create:
+                self.bulk_create(to_create)
 
-            return reaction_obj, action
+            self._update_comments_reaction_counters(deltas)
 
-    def _update_comment_reaction_counters(self, comment_id, old_reaction=None, new_reaction=None):
+        return {comment_id: final.get(comment_id) for comment_id in comment_ids}
+
+    def _reaction_deltas(self, old_reaction=None, new_reaction=None):
+        """returns: (likes, dis_likes) changes of comment counters"""
+        return (
+            (new_reaction == self.model.LIKE) - (old_reaction == self.model.LIKE),
+            (new_reaction == self.model.DISLIKE) - (old_reaction == self.model.DISLIKE),
+        )
+
+    def _update_comments_reaction_counters(self, deltas):
+        """apply {comment_id: (likes, dis_likes)} changes to counters of comments in one update"""
+        deltas = {comment_id: delta for comment_id, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+
+        shards = settings.COMMENT_REACTION_COUNTER_SHARDS
+        if shards:
+            for comment_id, (likes, dis_likes) in deltas.items():
+                CommentReactionCounterShard.objects.add(comment_id, random.randrange(shards), likes, dis_likes)
+            return
+
+        Comment.objects.filter(pk__in=deltas).update(
+            likes_count=F('likes_count') + Case(
+                *[When(pk=pk, then=Value(likes)) for pk, (likes, _) in deltas.items()], default=Value(0)
+            ),
+            dis_likes_count=F('dis_likes_count') + Case(
+                *[When(pk=pk, then=Value(dis_likes)) for pk, (_, dis_likes) in deltas.items()], default=Value(0)
+            ),
+        )
+
+    def _update_comment_reaction_counters(self, comment_id, old_reaction=None, new_reaction=None, manhwa_id=None):
         """
-        update likes_count, dis_likes_count, when need to update
+        update likes_count, dis_likes_count of comment and return new counters.
         if reaction is deleted, new_reaction must be None!
         if reaction created, old_reaction must be None!
         and if reaction changed, you must set both old_reaction & new_reaction
-        """
-        updates = {}
-
-        if old_reaction == self.model.LIKE:
-            updates['likes_count'] = F('likes_count') - 1
-        elif old_reaction == self.model.DISLIKE:
-            updates['dis_likes_count'] = F('dis_likes_count') - 1
 
-        if new_reaction == self.model.LIKE:
-            updates['likes_count'] = F('likes_count') + 1
-        elif new_reaction == self.model.DISLIKE:
-            updates['dis_likes_count'] = F('dis_likes_count') + 1
+        counters are returned by UPDATE ... RETURNING (supports_update_returning), or read after update on other databases.
+        if COMMENT_REACTION_COUNTER_SHARDS is set, changes are added to a random counter shard
+        instead of comment row, so togglers of a hot comment don't wait on one row lock.
 
-        if updates:
-            Comment.objects.filter(pk=comment_id).update(**updates)
+        returns: {likes_count, dis_likes_count}, None if comment (in manhwa) not exist
+        """
+        likes, dis_likes = self._reaction_deltas(old_reaction, new_reaction)
+        comments = Comment.objects.filter(pk=comment_id)
+        if manhwa_id is not None:
+            comments = comments.filter(manhwa_id=manhwa_id)
+
+        if supports_update_returning() and not settings.COMMENT_REACTION_COUNTER_SHARDS:
+            sql = f"""
+                UPDATE {Comment._meta.db_table}
+                SET likes_count = likes_count + %s, dis_likes_count = dis_likes_count + %s
+                WHERE id = %s {'AND manhwa_id = %s' if manhwa_id is not None else ''}
+                RETURNING likes_count, dis_likes_count
+            """
+            params = [likes, dis_likes, comment_id] + ([manhwa_id] if manhwa_id is not None else [])
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            return {'likes_count': row[0], 'dis_likes_count': row[1]} if row else None
+
+        shards = settings.COMMENT_REACTION_COUNTER_SHARDS
+        if shards:
+            # shard of not existing comment is rolled back by caller
+            CommentReactionCounterShard.objects.add(comment_id, random.randrange(shards), likes, dis_likes)
+        else:
+            comments.update(likes_count=F('likes_count') + likes, dis_likes_count=F('dis_likes_count') + dis_likes)
+
+        comment = comments.with_reaction_counts().only('id', 'likes_count', 'dis_likes_count').first()
+        return comment.reaction_counts() if comment else None
 
     def sync_comment_reaction_counters(self, comment_id):
-        """update likes & dis_likes count fields from db and real count of reactions"""
-
-        reactions = self.filter(comment_id=comment_id).aggregate(
-            likes=Count(When(reaction='lk', then=1)),
-            dis_likes=Count(When(reaction='dlk', then=1))
-        )
-        Comment.objects.filter(pk=comment_id).update(likes_count=reactions.likes, dis_likes_count=reactions.dis_likes)
+        """
+        set likes & dis_likes count fields of comment to real count of reactions and remove its counter shards.
+        comment row and every shard row a toggler can add to are locked before counting, so a toggle is
+        committed before the count (and counted) or waits and adds its change to a new shard after it.
+        """
+        with transaction.atomic():
+            if not Comment.objects.select_for_update().filter(pk=comment_id).values_list('pk', flat=True):
+                return
+
+            shards = settings.COMMENT_REACTION_COUNTER_SHARDS
+            if shards:
+                CommentReactionCounterShard.objects.bulk_create(
+                    [CommentReactionCounterShard(comment_id=comment_id, shard=shard) for shard in range(shards)],
+                    ignore_conflicts=True,
+                )
+            shard_ids = list(
+                CommentReactionCounterShard.objects.select_for_update().filter(comment_id=comment_id)
+                .values_list('pk', flat=True)
+            )
+
+            reactions = self.filter(comment_id=comment_id).aggregate(
+                likes=Count(Case(When(reaction=self.model.LIKE, then=1))),
+                dis_likes=Count(Case(When(reaction=self.model.DISLIKE, then=1)))
+            )
+            Comment.objects.filter(pk=comment_id).update(
+                likes_count=reactions['likes'],
+                dis_likes_count=reactions['dis_likes']
+            )
+            # only locked shards are counted in real count
+            CommentReactionCounterShard.objects.filter(pk__in=shard_ids).delete()
 
 
 class CommentReAction(models.Model):
@@ -324,6 +815,88 @@ class CommentReAction(models.Model):
         unique_together = ('user', 'comment')
 
 
+class CounterShardManager(models.Manager):
+    def add(self, comment_id, shard, likes, dis_likes):
+        """add likes & dis_likes deltas to a shard of comment, shard row created at first use"""
+        updates = {'likes': F('likes') + likes, 'dis_likes': F('dis_likes') + dis_likes}
+        if self.filter(comment_id=comment_id, shard=shard).update(**updates):
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(comment_id=comment_id, shard=shard, likes=likes, dis_likes=dis_likes)
+        except IntegrityError:  # created by another toggler at same time
+            self.filter(comment_id=comment_id, shard=shard).update(**updates)
+
+    def compact(self, batch_size=1000):
+        """
+        move deltas of shards into likes_count & dis_likes_count of comments, batch_size comments in each transaction.
+        all shards of a comment are moved together, a part of them may sum below zero.
+        moved values are subtracted from shards (not reset), so deltas added meanwhile are kept.
+
+        returns: count of compacted shards
+        """
+        compacted = 0
+        last_comment_id = 0
+        while True:
+            comment_ids = list(
+                self.filter(comment_id__gt=last_comment_id).exclude(likes=0, dis_likes=0).order_by('comment_id')
+                .values_list('comment_id', flat=True).distinct()[:batch_size]
+            )
+            if not comment_ids:
+                return compacted
+
+            with transaction.atomic():
+                shards = list(
+                    self.select_for_update().filter(comment_id__in=comment_ids).exclude(likes=0, dis_likes=0)
+                    .order_by('pk').values('pk', 'comment_id', 'likes', 'dis_likes')
+                )
+                comments = {}
+                for shard in shards:
+                    likes, dis_likes = comments.get(shard['comment_id'], (0, 0))
+                    comments[shard['comment_id']] = (likes + shard['likes'], dis_likes + shard['dis_likes'])
+
+                if shards:
+                    Comment.objects.filter(pk__in=comments).update(
+                        likes_count=F('likes_count') + Case(
+                            *[When(pk=pk, then=Value(likes)) for pk, (likes, _) in comments.items()],
+                            default=Value(0)
+                        ),
+                        dis_likes_count=F('dis_likes_count') + Case(
+                            *[When(pk=pk, then=Value(dis_likes)) for pk, (_, dis_likes) in comments.items()],
+                            default=Value(0)
+                        ),
+                    )
+                    self.filter(pk__in=[shard['pk'] for shard in shards]).update(
+                        likes=F('likes') - Case(
+                            *[When(pk=shard['pk'], then=Value(shard['likes'])) for shard in shards], default=Value(0)
+                        ),
+                        dis_likes=F('dis_likes') - Case(
+                            *[When(pk=shard['pk'], then=Value(shard['dis_likes'])) for shard in shards],
+                            default=Value(0)
+                        ),
+                    )
+
+            compacted += len(shards)
+            last_comment_id = comment_ids[-1]
+
+
+class CommentReactionCounterShard(models.Model):
+    """
+    not compacted likes & dis_likes changes of a comment.
+    used when COMMENT_REACTION_COUNTER_SHARDS is set, see CommentReactionManager.
+    """
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    likes = models.IntegerField(default=0)
+    dis_likes = models.IntegerField(default=0)
+
+    objects = CounterShardManager()
+
+    class Meta:
+        unique_together = ('comment', 'shard')
+
+
 class Ticket(models.Model):
     READ = 'r'
     UNREAD = 'unr'
@@ -1,5 +1,121 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, _reverse_ordering
 
 
 class CustomPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+
+class HomeCursorPagination(CursorPagination):
+    """keyset pagination of home page grid on datetime_created"""
+    page_size = 20
+    ordering = ('-datetime_created', '-id')
+
+
+class CommentCursorPagination(CursorPagination):
+    """keyset pagination of comments, served by (manhwa, -created_at) index"""
+    page_size = 10
+    ordering = '-created_at'
+
+
+class EpisodeCursorPagination(CursorPagination):
+    """keyset pagination of episodes of one manhwa, served by (manhwa, number) index"""
+    page_size = 50
+    ordering = 'number'
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    cursor pagination on all fields of a unique ordering (e.g. ('-views_count', '-id')).
+    drf cursors only keep position of first field and use offsets inside its ties, here cursor has
+    values of all fields and a page is filtered by (a < x) or (a = x and b < y) ..., so there is no offset.
+    """
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [instance[order.lstrip('-')] if isinstance(instance, dict) else getattr(instance, order.lstrip('-'))
+                  for order in ordering]
+        return json.dumps([str(value) for value in values])
+
+    def _position_filter(self, position, reverse):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition, equal = Q(), {}
+        for order, value in zip(self.ordering, values):
+            attr = order.lstrip('-')
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'  # (cursor reversed) XOR (field reversed)
+            condition |= Q(**equal, **{f'{attr}__{lookup}': value})
+            equal[attr] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # CursorPagination.paginate_queryset with position filter on all fields, offset is always 0
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (self.cursor.reverse, self.cursor.position) if self.cursor else (False, None)
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self._position_filter(current_position, reverse))
+            except (TypeError, ValueError, ValidationError):  # values of another field type
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if len(results) > len(self.page) else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.next_position = current_position is not None, current_position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = current_position is not None, current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class ManhwaCursorPagination(KeysetCursorPagination):
+    """
+    keyset pagination of manhwas, ordered by a choice of ?ordering= then id (served by (field, -id) indexes).
+    """
+    page_size = 10
+    ordering = ('-publication_datetime', '-id')
+    ordering_choices = ('-publication_datetime', '-views_count', '-avg_rating')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get('ordering')
+        return (ordering, '-id') if ordering in self.ordering_choices else self.ordering
+
+
+class CursorOptInMixin:
+    """
+    generic view mixin to let clients use cursor pagination by ?pagination=cursor.
+    cursor pages run no count query and offset scan (response has no count).
+    """
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.request.query_params.get('pagination') == 'cursor':
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
@@ -0,0 +1,34 @@
+"""
+tiny placeholder (lqip) and dominant color of covers, inlined in pages & apis so cards paint before
+their cover is loaded, without any image request.
+"""
+import base64
+import io
+
+from PIL import Image, ImageOps
+
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+# size that palette of dominant color is taken from
+SAMPLE_SIZE = 64
+
+
+def image_placeholder(file):
+    """
+    (data uri of a PLACEHOLDER_WIDTH px wide webp, dominant color '#rrggbb') of an image file.
+    raises OSError if file is not an image.
+    """
+    image = Image.open(file)
+    image.draft('RGB', (SAMPLE_SIZE, SAMPLE_SIZE))  # jpeg is decoded at a smaller scale
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+
+    # most common color of a 5 colors palette, average of all pixels is a muddy mix of them
+    palette = image.quantize(5)
+    _, index = max(palette.getcolors())
+    color = '#{:02x}{:02x}{:02x}'.format(*palette.getpalette()[index * 3:index * 3 + 3])
+
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    content = io.BytesIO()
+    image.resize((PLACEHOLDER_WIDTH, height), Image.BOX).save(content, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return f'data:image/webp;base64,{base64.b64encode(content.getvalue()).decode()}', color
@@ -0,0 +1,242 @@
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('manhwas.profiling')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMS_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """sql without values, so same statement with other params or IN list size is equal"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _PARAMS_LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class RequestProfile:
+    """
+    execute wrapper that records db time of each phase of request ('view', 'render')
+    and slowest queries of request. start is perf_counter of request start.
+    """
+
+    def __init__(self, start, slowest=5):
+        self.start = start
+        self.phase = 'view'
+        self.phase_start = {'view': time.perf_counter()}
+        self.phase_db = {'view': 0.0, 'render': 0.0}
+        self.queries = 0
+        self.slowest_count = slowest
+        self.slowest = []  # heap of (ms, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.queries += 1
+            self.phase_db[self.phase] += duration
+            if len(self.slowest) < self.slowest_count:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+    def start_render(self):
+        self.phase = 'render'
+        self.phase_start['render'] = time.perf_counter()
+
+    def result(self):
+        """timings in ms; view & render are python time of phase (db time of phase excluded)"""
+        end = time.perf_counter()
+        render_start = self.phase_start.get('render', end)
+        return {
+            'queries': self.queries,
+            'db_ms': round(sum(self.phase_db.values()), 2),
+            'view_ms': round((render_start - self.phase_start['view']) * 1000 - self.phase_db['view'], 2),
+            'render_ms': round((end - render_start) * 1000 - self.phase_db['render'], 2),
+            'total_ms': round((end - self.start) * 1000, 2),
+            'slowest': [
+                {'ms': round(ms, 2), 'sql': normalize_sql(sql)} for ms, sql in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+class RequestProfilingMiddleware:
+    """
+    log query count, db time, view time (serializers of api views run here), render time
+    and slowest queries of sampled requests as one json line in 'manhwas.profiling' logger.
+
+    REQUEST_PROFILING_SAMPLE_RATE: part of requests that are profiled (0 - 1), 0 disables profiling
+    REQUEST_PROFILING_VIEWS: only profile these view names (url names), all views if empty
+    REQUEST_PROFILING_SERVER_TIMING: add Server-Timing header to profiled responses
+
+    pages rendered in view (render shortcut) are counted in view time, render time is of
+    template responses (e.g. json rendering of drf).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        request._profiling_start = time.perf_counter()
+        with ExitStack() as stack:
+            request._profiling_stack = stack
+            response = self.get_response(request)
+
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            data = profile.result()
+            match = request.resolver_match
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                **data,
+            }))
+            if settings.REQUEST_PROFILING_SERVER_TIMING:
+                response['Server-Timing'] = self.server_timing(data)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stack = getattr(request, '_profiling_stack', None)
+        allowed = settings.REQUEST_PROFILING_VIEWS
+        if stack is None or (allowed and request.resolver_match.view_name not in allowed):
+            return None
+        if random.random() >= settings.REQUEST_PROFILING_SAMPLE_RATE:
+            return None
+
+        request._profile = RequestProfile(request._profiling_start, settings.REQUEST_PROFILING_SLOWEST_QUERIES)
+        stack.enter_context(connection.execute_wrapper(request._profile))
+        return None
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.start_render()
+        return response
+
+    @staticmethod
+    def server_timing(data):
+        return ', '.join((
+            f'db;dur={data["db_ms"]};desc="{data["queries"]} queries"',
+            f'view;dur={data["view_ms"]}',
+            f'render;dur={data["render_ms"]}',
+            f'total;dur={data["total_ms"]}',
+        ))
+
+
+nplusone_logger = logging.getLogger('manhwas.nplusone')
+
+
+class RepeatedQueriesError(AssertionError):
+    pass
+
+
+def _call_site(skip_files=(__file__,)):
+    """first frame of project code (not django, drf or this module) that runs the query"""
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(base_dir) and 'site-packages' not in filename and filename not in skip_files:
+            return f'{os.path.relpath(filename, base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class RepeatedQueriesCollector:
+    """
+    execute wrapper that groups queries by normalized sql and call site.
+    a group that runs more than threshold times is likely an N+1 (query per row of a list).
+    """
+
+    def __init__(self, threshold=5):
+        self.threshold = threshold
+        self.groups = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.groups[(normalize_sql(sql), _call_site())] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """groups that ran more than threshold times, most repeated first"""
+        return [
+            {'sql': sql, 'call_site': call_site, 'count': count}
+            for (sql, call_site), count in self.groups.most_common() if count > self.threshold
+        ]
+
+
+def format_repeated(repeated):
+    return '\n'.join(f'{group["count"]}x {group["call_site"]}: {group["sql"]}' for group in repeated)
+
+
+@contextmanager
+def assert_no_repeated_queries(threshold=5):
+    """
+    test helper, raises RepeatedQueriesError if a statement runs more than threshold times in block:
+        with assert_no_repeated_queries(threshold=2):
+            self.client.get(url)
+    """
+    collector = RepeatedQueriesCollector(threshold)
+    with connection.execute_wrapper(collector):
+        yield collector
+
+    repeated = collector.repeated()
+    if repeated:
+        raise RepeatedQueriesError(f'repeated queries (more than {threshold} times):\n{format_repeated(repeated)}')
+
+
+class RepeatedQueriesMiddleware:
+    """
+    detect N+1 queries of requests, for staging or development.
+
+    N_PLUS_ONE_DETECTION: '' disables it, 'log' logs a warning json line in 'manhwas.nplusone' logger,
+    'raise' raises RepeatedQueriesError (500 response)
+    N_PLUS_ONE_THRESHOLD: max times that a statement can run from one call site in a request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.N_PLUS_ONE_DETECTION
+        if not mode:
+            return self.get_response(request)
+
+        collector = RepeatedQueriesCollector(settings.N_PLUS_ONE_THRESHOLD)
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+
+        repeated = collector.repeated()
+        if repeated:
+            if mode == 'raise':
+                raise RepeatedQueriesError(f'repeated queries in {request.path}:\n{format_repeated(repeated)}')
+
+            match = request.resolver_match
+            nplusone_logger.warning(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'repeated': repeated,
+            }))
+        return response
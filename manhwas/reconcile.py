@@ -0,0 +1,137 @@
+from django.db import connection
+from django.db.models import Min, Max
+
+from .models import Comment, CommentReAction, CommentReactionCounterShard, Manhwa, View
+
+
+def _comment_reactions_source(manhwa_range):
+    """
+    select real likes_count & dis_likes_count of comments with id between %(lo)s and %(hi)s.
+    deltas of counter shards are subtracted, so stored counter + shards stays equal to real count.
+    counters are clamped at 0 (counter columns are positive), shards larger than real count are not reconciled.
+    """
+    manhwa_filter = 'AND c.manhwa_id BETWEEN %(manhwa_from)s AND %(manhwa_to)s' if manhwa_range else ''
+    # GREATEST() of sqlite is multi-argument MAX()
+    greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+    return f"""
+        SELECT c.id AS id,
+               {greatest}(COALESCE(r.likes, 0) - COALESCE(s.likes, 0), 0) AS likes_count,
+               {greatest}(COALESCE(r.dis_likes, 0) - COALESCE(s.dis_likes, 0), 0) AS dis_likes_count
+        FROM {Comment._meta.db_table} c
+        LEFT JOIN (
+            SELECT comment_id,
+                   SUM(CASE WHEN reaction = %(like)s THEN 1 ELSE 0 END) AS likes,
+                   SUM(CASE WHEN reaction = %(dislike)s THEN 1 ELSE 0 END) AS dis_likes
+            FROM {CommentReAction._meta.db_table}
+            WHERE comment_id BETWEEN %(lo)s AND %(hi)s
+            GROUP BY comment_id
+        ) r ON r.comment_id = c.id
+        LEFT JOIN (
+            SELECT comment_id, SUM(likes) AS likes, SUM(dis_likes) AS dis_likes
+            FROM {CommentReactionCounterShard._meta.db_table}
+            WHERE comment_id BETWEEN %(lo)s AND %(hi)s
+            GROUP BY comment_id
+        ) s ON s.comment_id = c.id
+        WHERE c.id BETWEEN %(lo)s AND %(hi)s {manhwa_filter}
+    """
+
+
+def _manhwa_views_source():
+    """select real views_count of manhwas with id between %(lo)s and %(hi)s."""
+    return f"""
+        SELECT m.id AS id, COALESCE(v.views, 0) AS views_count
+        FROM {Manhwa._meta.db_table} m
+        LEFT JOIN (
+            SELECT manhwa_id, COUNT(*) AS views
+            FROM {View._meta.db_table}
+            WHERE manhwa_id BETWEEN %(lo)s AND %(hi)s
+            GROUP BY manhwa_id
+        ) v ON v.manhwa_id = m.id
+        WHERE m.id BETWEEN %(lo)s AND %(hi)s
+    """
+
+
+def _reconcile_chunk(table, columns, source, params, dry_run):
+    """
+    set columns of rows that drifted from source in one UPDATE ... FROM statement.
+    with dry_run, only select drifted rows.
+
+    returns: list of (id, stored values..., real values...) if dry_run, else count of updated rows
+    """
+    drifted = ' OR '.join(f't.{col} <> src.{col}' for col in columns)
+    with connection.cursor() as cursor:
+        if dry_run:
+            cursor.execute(f"""
+                SELECT t.id, {', '.join(f't.{col}' for col in columns)}, {', '.join(f'src.{col}' for col in columns)}
+                FROM {table} t JOIN ({source}) src ON src.id = t.id
+                WHERE {drifted}
+                ORDER BY t.id
+            """, params)
+            return cursor.fetchall()
+
+        cursor.execute(f"""
+            UPDATE {table} AS t SET {', '.join(f'{col} = src.{col}' for col in columns)}
+            FROM ({source}) AS src
+            WHERE src.id = t.id AND ({drifted})
+        """, params)
+        return cursor.rowcount
+
+
+def _reconcile(model, columns, source, id_range, params, chunk_size, dry_run):
+    """
+    reconcile columns of model rows in id ranges of chunk_size, every chunk in its own statement,
+    so rows of one chunk are locked only while that chunk is updated.
+
+    returns: dict of {rows: drifted (or updated) rows count, drift: {column: sum of absolute drift}, samples: ids}
+    """
+    result = {'rows': 0, 'drift': {col: 0 for col in columns}, 'samples': []}
+    first, last = id_range
+    if first is None:
+        return result
+
+    for lo in range(first, last + 1, chunk_size):
+        chunk_params = {**params, 'lo': lo, 'hi': min(lo + chunk_size - 1, last)}
+        chunk = _reconcile_chunk(model._meta.db_table, columns, source, chunk_params, dry_run)
+        if not dry_run:
+            result['rows'] += chunk
+            continue
+
+        result['rows'] += len(chunk)
+        for row in chunk:
+            for i, col in enumerate(columns, start=1):
+                result['drift'][col] += abs(row[i] - row[i + len(columns)])
+            if len(result['samples']) < 10:
+                result['samples'].append(row[0])
+
+    return result
+
+
+def reconcile_comment_reactions(manhwa_range=None, chunk_size=10000, dry_run=False):
+    """
+    recompute likes_count & dis_likes_count of comments (of manhwas in manhwa_range) from reactions.
+    a reaction committed while its chunk is updated, may be off until next run.
+    """
+    query = Comment.objects.all()
+    params = {'like': CommentReAction.LIKE, 'dislike': CommentReAction.DISLIKE}
+    if manhwa_range:
+        query = query.filter(manhwa__id__range=manhwa_range)
+        params.update(manhwa_from=manhwa_range[0], manhwa_to=manhwa_range[1])
+
+    id_range = query.aggregate(first=Min('id'), last=Max('id')).values()
+    return _reconcile(
+        Comment, ('likes_count', 'dis_likes_count'), _comment_reactions_source(manhwa_range),
+        tuple(id_range), params, chunk_size, dry_run
+    )
+
+
+def reconcile_manhwa_views(manhwa_range=None, chunk_size=10000, dry_run=False):
+    """recompute views_count of manhwas (in manhwa_range) from saved views."""
+    query = Manhwa.objects.all()
+    if manhwa_range:
+        query = query.filter(id__range=manhwa_range)
+
+    id_range = query.aggregate(first=Min('id'), last=Max('id')).values()
+    return _reconcile(
+        Manhwa, ('views_count',), _manhwa_views_source(),
+        tuple(id_range), {}, chunk_size, dry_run
+    )
@@ -6,6 +6,7 @@ from rest_framework import serializers
 
 from django.db import IntegrityError, transaction
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils.translation import gettext as _
 
 from .models import Manhwa, CommentReAction, Comment, Episode, Ticket, TicketMessage, Rate, Genre, View
@@ -40,7 +41,8 @@ class CreateCommentSerializer(serializers.ModelSerializer):
 
 class RetrieveCommentSerializer(serializers.ModelSerializer):
     author = serializers.CharField(source='author.username', read_only=True)
-    replies_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(source='current_likes_count', read_only=True)
+    dis_likes_count = serializers.IntegerField(source='current_dis_likes_count', read_only=True)
     user_reaction = serializers.CharField(max_length=1, read_only=True)
 
     class Meta:
@@ -51,21 +53,20 @@ class RetrieveCommentSerializer(serializers.ModelSerializer):
             'replies_count', 'user_reaction'
         )
 
-    def get_replies_count(self, obj):
-        return obj.children.count()
-
 
 class CommentDetailSerializer(serializers.ModelSerializer):
     author = serializers.CharField(source='author.username', read_only=True)
     replies = RetrieveCommentSerializer(source='children', many=True, read_only=True)
-    replies_count = serializers.SerializerMethodField()
+    likes_count = serializers.IntegerField(source='current_likes_count', read_only=True)
+    dis_likes_count = serializers.IntegerField(source='current_dis_likes_count', read_only=True)
+    user_reaction = serializers.CharField(max_length=1, read_only=True)
 
     class Meta:
         model = Comment
-        fields = ('id', 'author', 'text', 'parent', 'level', 'likes_count', 'dis_likes_count', 'replies_count', 'replies')
-
-    def get_replies_count(self, obj):
-        return obj.children.count()
+        fields = (
+            'id', 'author', 'text', 'parent', 'level', 'likes_count',
+            'dis_likes_count', 'replies_count', 'user_reaction', 'replies'
+        )
 
 
 class ManhwaGenresSerializer(serializers.ModelSerializer):
@@ -88,14 +89,14 @@ class SetViewManhwaSerializer(serializers.Serializer):
     pass
 
 class DetailManhwaSerializer(serializers.ModelSerializer):
-    comments_count = serializers.IntegerField(source='comments.count', read_only=True)
     cover = serializers.URLField(source='cover.url', read_only=True)
+    cover_srcset = serializers.DictField(source='cover_srcsets', child=serializers.CharField(), read_only=True)
     rating_data = RatingDetailSerializer(read_only=True)
     genres = serializers.SerializerMethodField()
 
     class Meta:
         model = Manhwa
-        fields = ['id', 'en_title', 'genres', 'rating_data', 'season', 'day_of_week', 'last_upload', 'studio', 'views_count', 'comments_count', 'cover']
+        fields = ['id', 'en_title', 'genres', 'rating_data', 'season', 'day_of_week', 'last_upload', 'studio', 'views_count', 'comments_count', 'cover', 'cover_srcset', 'cover_placeholder', 'cover_color']
 
     def get_genres(self, obj):
         # return only title of genres instead of many dicts with key&value
@@ -105,13 +106,13 @@ class DetailManhwaSerializer(serializers.ModelSerializer):
 
 
 class ManhwaSerializer(serializers.ModelSerializer):
-    comments_count = serializers.IntegerField(source='comments.count', read_only=True)
     cover = serializers.URLField(source='cover.url', read_only=True)
+    cover_srcset = serializers.DictField(source='cover_srcsets', child=serializers.CharField(), read_only=True)
     avg_rating = serializers.DecimalField(max_digits=3, decimal_places=1, read_only=True)
 
     class Meta:
         model = Manhwa
-        fields = ['id', 'en_title', 'avg_rating', 'season', 'day_of_week', 'last_upload', 'views_count', 'comments_count', 'cover']  # + 'comments'
+        fields = ['id', 'en_title', 'avg_rating', 'season', 'day_of_week', 'last_upload', 'views_count', 'comments_count', 'cover', 'cover_srcset', 'cover_placeholder', 'cover_color']  # + 'comments'
 
 
 class CreateManhwaSerializer(serializers.ModelSerializer):
@@ -132,7 +133,7 @@ class ManhwaRatingSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         manhwa_id = self.context['manhwa_id']
         user = self.context['request'].user
-        rate_obj, self._was_created = Rate.objects.update_or_create(user=user, manhwa_id=manhwa_id, defaults=validated_data)
+        rate_obj, self._was_created = Rate.objects.set_rating(user, manhwa_id, validated_data['rating'])
         return rate_obj
 
     @property
@@ -157,12 +158,15 @@ class CommentReActionSerializer(serializers.ModelSerializer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._action = None
+        self._counts = None
 
     def save(self, **kwargs):
-        reaction_obj, self._action = CommentReAction.objects.toggle_reaction(
+        """raises Comment.DoesNotExist if comment not exist in manhwa of context"""
+        reaction_obj, self._action, self._counts = CommentReAction.objects.toggle_reaction_counts(
             user=self.context['request'].user,
             comment_id=self.context['comment_id'],
-            reaction=self.validated_data['reaction']
+            reaction=self.validated_data['reaction'],
+            manhwa_id=self.context.get('manhwa_id'),
         )
         return reaction_obj
 
@@ -170,20 +174,33 @@ class CommentReActionSerializer(serializers.ModelSerializer):
     def action(self):
         return self._action
 
+    @property
+    def counts(self):
+        """likes_count & dis_likes_count of comment after toggle"""
+        return self._counts
+
 
 
 class CommentReactionToggleSerializer(serializers.Serializer):
     comment_id = serializers.IntegerField()
     reaction = serializers.ChoiceField(choices=CommentReAction.COMMENT_REACTIONS)
+    # existing of comment is checked by toggle_reaction_counts, in same query that updates counters
 
-    def validate_comment_id(self, value):
-        """check existing of comment"""
-        try:
-            Comment.objects.get(pk=value)
-        except Comment.DoesNotExist:
-            raise serializers.ValidationError("comment not fount")
 
-        return value
+class CommentReactionPairSerializer(serializers.Serializer):
+    comment_id = serializers.IntegerField()
+    reaction = serializers.ChoiceField(choices=CommentReAction.COMMENT_REACTIONS)
+
+
+class CommentReactionBatchSerializer(serializers.Serializer):
+    reactions = CommentReactionPairSerializer(many=True, allow_empty=False, max_length=100)
+
+    def save(self, **kwargs):
+        """apply toggles in order, returns: {comment_id: final reaction or None}"""
+        return CommentReAction.objects.toggle_reactions(
+            user=self.context['request'].user,
+            pairs=[(pair['comment_id'], pair['reaction']) for pair in self.validated_data['reactions']]
+        )
 
 
 class ManhwaViewSerializer(serializers.Serializer):
@@ -199,11 +216,19 @@ class ManhwaViewSerializer(serializers.Serializer):
 
 
 class EpisodeSerializer(serializers.ModelSerializer):
-    file = serializers.URLField(source='file.url')
+    # file is the download url too, raw media url of file is not exposed, so every download is counted
+    file = serializers.SerializerMethodField(method_name='get_download')
+    download = serializers.SerializerMethodField()
 
     class Meta:
         model = Episode
-        fields = ['id', 'number', 'file', 'datetime_created']
+        fields = ['id', 'number', 'file', 'download', 'datetime_created']
+
+    def get_download(self, obj):
+        # counted & resumable download of episode file
+        url = reverse('manhwa-episodes-download', args=[obj.manhwa_id, obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
 
 class ListTicketSerializer(serializers.ModelSerializer):
@@ -0,0 +1,78 @@
+from django.db.models import Value, Subquery, OuterRef, Prefetch
+from django.db.models.functions import Coalesce
+from django.shortcuts import get_object_or_404
+
+from rest_framework.request import Request
+
+from . import serializers as srilzr
+from .models import Comment, CommentReAction, Episode
+from .paginations import CustomPagination, EpisodeCursorPagination
+
+
+def with_user_reaction(query, user):
+    """annotate user_reaction of authenticated user on comments queryset"""
+    if not user.is_authenticated:
+        return query
+
+    return query.annotate(
+        user_reaction=Coalesce(
+            Subquery(CommentReAction.objects.filter(
+                user_id=user.id,
+                comment_id=OuterRef('pk')
+                ).values('reaction')),
+            Value('no-reaction')
+        ),
+    )
+
+
+def top_level_comments(manhwa, user):
+    """
+    queryset of level 0 comments of manhwa.
+    if user is authenticated, every comment annotated with user_reaction.
+    """
+    query = Comment.objects.with_reaction_counts().select_related('author').filter(manhwa=manhwa, level=0)
+    return with_user_reaction(query, user)
+
+
+def get_reply_tree(manhwa_id, comment_id, user):
+    """
+    load comment with its replies and reaction of user on each of them, in 2 queries.
+    replies of replies are only counted by stored replies_count (max depth of comments is 3).
+    raises Http404 if comment not exist in manhwa.
+    """
+    replies_qs = with_user_reaction(Comment.objects.with_reaction_counts().select_related('author'), user)
+    query = Comment.objects.with_reaction_counts().select_related('author').prefetch_related(
+        Prefetch('children', queryset=replies_qs)
+    )
+    return get_object_or_404(with_user_reaction(query, user), manhwa_id=manhwa_id, pk=comment_id)
+
+
+def get_comments_page(request, manhwa, paginator=None):
+    """
+    return a page of manhwa comments as dict: {count, next, previous, results}.
+    same structure of comments list api, without any http call to api.
+    request can be django HttpRequest or drf Request.
+    """
+    user = request.user
+    if not isinstance(request, Request):
+        request = Request(request)  # paginator needs query_params
+
+    paginator = paginator or CustomPagination()
+    page = paginator.paginate_queryset(top_level_comments(manhwa, user), request)
+    serializer = srilzr.RetrieveCommentSerializer(page, many=True, context={'request': request})
+
+    return paginator.get_paginated_response(serializer.data).data
+
+
+def get_episodes_page(request, manhwa_id):
+    """
+    one keyset page of episodes of manhwa: (episodes, next link).
+    only this page is loaded, however many episodes the manhwa has.
+    """
+    if not isinstance(request, Request):
+        request = Request(request)  # paginator needs query_params
+
+    paginator = EpisodeCursorPagination()
+    episodes = Episode.objects.filter(manhwa_id=manhwa_id).only('id', 'manhwa_id', 'number')
+    page = paginator.paginate_queryset(episodes, request)
+    return page, paginator.get_next_link()
@@ -0,0 +1,89 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import HOME_GRID, bump_version_on_commit, manhwa_detail_name
+from .models import Manhwa, Episode, Rate, Comment
+
+
+@receiver(post_delete, sender=Rate)
+def decrease_rating_counters(sender, instance, **kwargs):
+    """keep rating counters of manhwa after a rate deleted (admin, cascade, queryset delete)"""
+    Rate.objects._update_manhwa_rating_counters(instance.manhwa_id, old_rating=instance.rating)
+
+
+@receiver(post_save, sender=Manhwa)
+@receiver(post_delete, sender=Manhwa)
+@receiver(post_save, sender=Rate)
+@receiver(post_delete, sender=Rate)
+def invalidate_home_grid(sender, **kwargs):
+    # rating counters (Rate.save) & last_upload (reserve_numbers) are committed after the signal
+    bump_version_on_commit(HOME_GRID)
+
+
+@receiver(post_save, sender=Episode)
+def invalidate_home_grid_on_new_episode(sender, created, **kwargs):
+    if created:  # last_upload of manhwa changed
+        bump_version_on_commit(HOME_GRID)
+
+
+@receiver(post_save, sender=Comment)
+def increase_comments_count(sender, instance, created, **kwargs):
+    if created:
+        Manhwa.objects.filter(pk=instance.manhwa_id).update(comments_count=F('comments_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrease_comments_count(sender, instance, **kwargs):
+    Manhwa.objects.filter(pk=instance.manhwa_id).update(comments_count=F('comments_count') - 1)
+    # replies of deleted comment are set to null parent, but parent of it has one less reply
+    Comment._update_replies_count(instance.parent_id, -1)
+
+
+def invalidate_manhwa_detail(manhwa_id):
+    """drop cached detail of manhwa now, and again after commit"""
+    bump_version_on_commit(manhwa_detail_name(manhwa_id))
+
+
+@receiver(post_save, sender=Manhwa)
+@receiver(post_delete, sender=Manhwa)
+def invalidate_detail_of_manhwa(sender, instance, **kwargs):
+    invalidate_manhwa_detail(instance.pk)
+
+
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+@receiver(post_save, sender=Rate)
+@receiver(post_delete, sender=Rate)
+def invalidate_detail_of_related_manhwa(sender, instance, **kwargs):
+    invalidate_manhwa_detail(instance.manhwa_id)
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_detail_on_new_comment(sender, instance, created, **kwargs):
+    if created:  # comments_count of manhwa changed
+        invalidate_manhwa_detail(instance.manhwa_id)
+
+
+@receiver(post_delete, sender=Comment)
+def invalidate_detail_on_deleted_comment(sender, instance, **kwargs):
+    invalidate_manhwa_detail(instance.manhwa_id)
+
+
+@receiver(m2m_changed, sender=Manhwa.genres.through)
+def invalidate_detail_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        manhwa_ids = [instance.pk] if action.startswith('post_') else []
+    elif action in ('post_add', 'post_remove'):  # manhwas added to or removed from a genre
+        manhwa_ids = list(pk_set)
+    elif action == 'pre_clear':  # manhwas of genre are not known after clear
+        manhwa_ids = list(sender.objects.filter(genre_id=instance.pk).values_list('manhwa_id', flat=True))
+    else:
+        return
+
+    if manhwa_ids:
+        # genres are in payload of manhwa apis, their validators use datetime_modified
+        Manhwa.objects.filter(pk__in=manhwa_ids).update(datetime_modified=timezone.now())
+    for manhwa_id in manhwa_ids:
+        invalidate_manhwa_detail(manhwa_id)
@@ -1,14 +1,39 @@
 from PIL import Image
-from io import BytesIO
+from html import unescape
+from io import BytesIO, StringIO
+from re import search
+from tempfile import mkdtemp
+import base64
+import os
+import shutil
+import zipfile
+from unittest.mock import patch
 import json
 
+from django.contrib.admin import helpers
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
 from django.shortcuts import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APIClient
 
-from .models import Genre, Rate, Studio, Manhwa, CommentReAction, Comment
+from .cache import HOME_GRID, MANHWA_DETAIL, cache_metrics, get_version
+from .covers import COVER_FORMATS, pending_covers
+from .ingest import ingest_episodes
+from .models import (
+    Genre, Rate, Studio, Manhwa, CommentReAction, CommentReactionCounterShard, Comment, View, Episode,
+    supports_update_returning,
+)
+from .paginations import HomeCursorPagination, CommentCursorPagination, ManhwaCursorPagination
+from .profiling import RepeatedQueriesError, assert_no_repeated_queries, normalize_sql
+from .view_buffer import record_view, flush_downloads, flush_views
 from accounts.models import CustomUser
 
 
@@ -27,7 +52,29 @@ def get_image():
     )
 
 
-class ManhwaApiTest(TestCase):
+def use_temp_dirs(test, *setting_names):
+    """override directory settings of a test with new temp directories, removed after the test"""
+    directories = {name: mkdtemp() for name in setting_names}
+    for directory in directories.values():
+        test.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+    override = test.settings(**directories)
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+class TempMediaTestCase(TestCase):
+    """files saved by tests of class (also by its setUpTestData) go to a temp MEDIA_ROOT, removed after the class"""
+    @classmethod
+    def setUpClass(cls):
+        media_root = mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        cls.addClassCleanup(override.disable)
+        super().setUpClass()
+
+
+class ManhwaApiTest(TempMediaTestCase):
     @classmethod
     def setUpTestData(cls):
         cls.user = CustomUser.objects.create_user(
@@ -196,6 +243,90 @@ class ManhwaApiTest(TestCase):
         self.assertIn(comment.id, comment_ids)
         self.assertNotIn(comment2.id, comment_ids)
 
+    def test_comments_cursor_pagination(self):
+        for i in range(CommentCursorPagination.page_size):
+            Comment.objects.create(author=self.user2, manhwa=self.manhwa, text=f'cursor comment {i}')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('manhwa-comments-list', args=[self.manhwa.id]), {'pagination': 'cursor'})
+        data = response.json()
+
+        self.assertNotIn('count', data)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+        self.assertEqual(len(data['results']), CommentCursorPagination.page_size)
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([comment['id'] for comment in data['results']], [self.new_comment.id])
+
+    def test_get_comment_replies_queries(self):
+        for i in range(3):
+            reply = Comment.objects.create(
+                author=self.user,
+                manhwa=self.manhwa,
+                text=f'reply {i}',
+                parent_id=self.new_comment.id
+            )
+            Comment.objects.create(author=self.user, manhwa=self.manhwa, text=f'reply of reply {i}', parent=reply)
+            CommentReAction.objects.toggle_reaction(self.user, reply.id, CommentReAction.LIKE)
+
+        with self.assertNumQueries(3):  # user, comment, replies
+            response = self.client.get(
+                reverse('manhwa-comments-replies', args=[self.manhwa.id, self.new_comment.id]),
+                headers={'authorization': f'JWT {self.access}'}
+            )
+        data = response.json()
+        self.assertEqual(data['replies_count'], 3)
+        self.assertEqual(data['user_reaction'], 'no-reaction')
+        self.assertEqual([reply['replies_count'] for reply in data['replies']], [1, 1, 1])
+        self.assertEqual([reply['user_reaction'] for reply in data['replies']], ['lk', 'lk', 'lk'])
+
+    def test_replies_count(self):
+        reply = Comment.objects.create(author=self.user, manhwa=self.manhwa, text='reply', parent=self.new_comment)
+        reply_of_reply = Comment.objects.create(author=self.user, manhwa=self.manhwa, text='reply 2', parent=reply)
+        other = Comment.objects.create(author=self.user, manhwa=self.manhwa, text='other')
+
+        self.new_comment.refresh_from_db()
+        reply.refresh_from_db()
+        self.assertEqual((self.new_comment.replies_count, reply.replies_count), (1, 1))
+
+        # parent changed
+        reply_of_reply = Comment.objects.get(pk=reply_of_reply.pk)
+        reply_of_reply.parent = other
+        reply_of_reply.save()
+        reply.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((reply.replies_count, other.replies_count), (0, 1))
+
+        # parent_id deferred: an edit doesn't count the reply again
+        edited = Comment.objects.only('id', 'text').get(pk=reply_of_reply.pk)
+        edited.text = 'edited'
+        edited.save()
+        other.refresh_from_db()
+        self.assertEqual(other.replies_count, 1)
+
+        # deleted parent: replies get null parent, parent of deleted comment loses a reply
+        reply_of_reply = Comment.objects.create(author=self.user, manhwa=self.manhwa, text='reply 3', parent=reply)
+        reply.delete()
+        self.new_comment.refresh_from_db()
+        reply_of_reply.refresh_from_db()
+        self.assertEqual(self.new_comment.replies_count, 0)
+        self.assertIsNone(reply_of_reply.parent_id)
+
+    def test_show_replied_comment_page(self):
+        reply = Comment.objects.create(
+            author=self.user,
+            manhwa=self.manhwa,
+            text='reply text for page',
+            parent_id=self.new_comment.id
+        )
+        response = self.client.get(reverse('manhwa_comment_replies', args=[self.manhwa.id, self.new_comment.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reply.text)
+
+        response = self.client.get(reverse('manhwa_comment_replies', args=[self.manhwa.id + 1, self.new_comment.id]))
+        self.assertEqual(response.status_code, 404)
+
     #  for model not api
     def test_comment_reaction_manager(self):
         self.assertEqual(self.new_comment.likes_count, 0)
@@ -237,6 +368,56 @@ class ManhwaApiTest(TestCase):
         self.assertEqual(self.new_comment.likes_count, 0)
         self.assertEqual(self.new_comment.dis_likes_count, 0)
 
+    def test_reaction_counters_without_update_returning(self):
+        with patch.object(connection, 'vendor', 'mysql'):  # mariadb has INSERT ... RETURNING only
+            self.assertFalse(supports_update_returning())
+            _, action, counts = CommentReAction.objects.toggle_reaction_counts(
+                self.user, self.new_comment.id, CommentReAction.LIKE
+            )
+        self.assertEqual((action, counts), ('created', {'likes_count': 1, 'dis_likes_count': 0}))
+
+    @override_settings(COMMENT_REACTION_COUNTER_SHARDS=4)
+    def test_sharded_reaction_counters(self):
+        CommentReAction.objects.toggle_reaction(self.user, self.new_comment.id, CommentReAction.LIKE)
+        CommentReAction.objects.toggle_reaction(self.user2, self.new_comment.id, CommentReAction.LIKE)
+        CommentReAction.objects.toggle_reaction(self.user2, self.new_comment.id, CommentReAction.DISLIKE)
+
+        self.new_comment.refresh_from_db()
+        self.assertEqual((self.new_comment.likes_count, self.new_comment.dis_likes_count), (0, 0))  # in shards
+
+        response = self.client.get(reverse('manhwa-comments-list', args=[self.manhwa.id]))
+        comment_data = response.json()['results'][0]
+        self.assertEqual((comment_data['likes_count'], comment_data['dis_likes_count']), (1, 1))  # summed on read
+
+        call_command('compact_reaction_shards', stdout=StringIO())
+        self.new_comment.refresh_from_db()
+        self.assertEqual((self.new_comment.likes_count, self.new_comment.dis_likes_count), (1, 1))
+        self.assertEqual(Comment.objects.with_reaction_counts().get(pk=self.new_comment.pk).reaction_counts(),
+                         {'likes_count': 1, 'dis_likes_count': 1})
+
+        CommentReAction.objects.toggle_reaction(self.user, self.new_comment.id, CommentReAction.LIKE)  # unlike
+        CommentReAction.objects.sync_comment_reaction_counters(self.new_comment.id)
+        self.assertEqual(Comment.objects.with_reaction_counts().get(pk=self.new_comment.pk).reaction_counts(),
+                         {'likes_count': 0, 'dis_likes_count': 1})
+        self.assertFalse(self.new_comment.counter_shards.exists())
+
+        CommentReAction.objects.toggle_reaction(self.user, self.new_comment.id, CommentReAction.LIKE)  # after sync
+        self.assertEqual(Comment.objects.with_reaction_counts().get(pk=self.new_comment.pk).reaction_counts(),
+                         {'likes_count': 1, 'dis_likes_count': 1})
+
+    def test_compact_shards_of_comment_together(self):
+        # like went to a shard with a higher pk, unlike to a shard with a lower pk
+        other = Comment.objects.create(author=self.user, manhwa=self.manhwa, text='other')
+        CommentReactionCounterShard.objects.create(comment=self.new_comment, shard=0, likes=-1)
+        CommentReactionCounterShard.objects.create(comment=other, shard=0, likes=1)
+        CommentReactionCounterShard.objects.create(comment=self.new_comment, shard=1, likes=1, dis_likes=1)
+
+        self.assertEqual(CommentReactionCounterShard.objects.compact(batch_size=1), 3)
+        counts = dict(Comment.objects.filter(pk__in=[self.new_comment.pk, other.pk]).values_list('pk', 'likes_count'))
+        self.assertEqual(counts, {self.new_comment.pk: 0, other.pk: 1})
+        self.assertEqual(Comment.objects.get(pk=self.new_comment.pk).dis_likes_count, 1)
+        self.assertFalse(CommentReactionCounterShard.objects.exclude(likes=0, dis_likes=0).exists())
+
     def test_toggle_reaction(self):
         # create and then update reaction
 
@@ -265,8 +446,45 @@ class ManhwaApiTest(TestCase):
         self.assertEqual(data['reaction']['reaction'], reaction)
         self.assertEqual(data['action'], 'deleted')
 
+    def test_batch_reactions(self):
+        other_comment = Comment.objects.create(author=self.user2, text='other comment', manhwa=self.manhwa)
+        CommentReAction.objects.toggle_reaction(self.user, other_comment.id, CommentReAction.LIKE)
+        CommentReAction.objects.toggle_reaction(self.user2, other_comment.id, CommentReAction.LIKE)
+
+        pairs = [
+            (self.new_comment.id, 'lk'), (other_comment.id, 'dlk'),  # create, update
+            (self.new_comment.id, 'dlk'), (other_comment.id + 100, 'lk'),  # update, not existing comment
+        ]
+        # jwt user, comments, lock reactions, update, create, counters + savepoint, release, read counters
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse('comment-reactions-batch'),
+                json.dumps({'reactions': [{'comment_id': pk, 'reaction': reaction} for pk, reaction in pairs]}),
+                content_type='application/json',
+                headers={'authorization': f'JWT {self.access}'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'comments': [
+                {'id': self.new_comment.id, 'reaction': 'dlk', 'likes_count': 0, 'dis_likes_count': 1},
+                {'id': other_comment.id, 'reaction': 'dlk', 'likes_count': 1, 'dis_likes_count': 1},
+            ],
+            'not_found': [other_comment.id + 100],
+        })
+
+        # same reaction again deletes it, like single toggle
+        response = self.client.post(
+            reverse('comment-reactions-batch'),
+            json.dumps({'reactions': [{'comment_id': other_comment.id, 'reaction': 'dlk'}]}),
+            content_type='application/json',
+            headers={'authorization': f'JWT {self.access}'}
+        )
+        self.assertEqual(response.json()['comments'],
+                         [{'id': other_comment.id, 'reaction': None, 'likes_count': 1, 'dis_likes_count': 0}])
+        self.assertFalse(CommentReAction.objects.filter(user=self.user, comment=other_comment).exists())
+
     def test_all_api_query(self):
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(4):  # + comments_count of manhwa
             self.client.post(
                 reverse('manhwa-comments-list', args=[self.manhwa.id]),
                 json.dumps({
@@ -275,7 +493,7 @@ class ManhwaApiTest(TestCase):
                 content_type='application/json',
                 headers={'authorization': f'JWT {self.access}'}
             )
-        with self.assertNumQueries(4):
+        with self.assertNumQueries(6):  # + replies_count of parent
             self.client.post(
                 reverse('manhwa-comments-list', args=[self.manhwa.id]),
                 json.dumps({
@@ -294,7 +512,8 @@ class ManhwaApiTest(TestCase):
         with self.assertNumQueries(5):
             CommentReAction.objects.toggle_reaction(self.user, self.new_comment.id, CommentReAction.DISLIKE)
 
-        with self.assertNumQueries(10):
+        # jwt user, savepoint, lock reaction, update counters returning them, insert reaction, release
+        with self.assertNumQueries(6):
             response = self.client.post(
                 reverse('manhwa-comments-reaction', args=[self.manhwa.id, self.new_comment.id]),
                 json.dumps({'reaction': 'lk'}),
@@ -304,6 +523,57 @@ class ManhwaApiTest(TestCase):
             data = response.json()
             self.assertEqual(data['reaction']['reaction'], 'lk')
             self.assertEqual(data['action'], 'created')
+            self.assertEqual(data['comment'], {'likes_count': 1, 'dis_likes_count': 0})
+
+    def test_reaction_on_comment_of_other_manhwa(self):
+        other_manhwa = Manhwa.objects.create(
+            en_title='other manhwa', summary='summary', day_of_week=Manhwa.SUNDAY,
+            cover=get_image(), publication_datetime=timezone.now(), studio=self.studio,
+        )
+        response = self.client.post(
+            reverse('manhwa-comments-reaction', args=[other_manhwa.id, self.new_comment.id]),
+            json.dumps({'reaction': 'lk'}),
+            content_type='application/json',
+            headers={'authorization': f'JWT {self.access}'}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(CommentReAction.objects.filter(comment=self.new_comment).exists())
+        self.assertEqual(Comment.objects.get(pk=self.new_comment.pk).likes_count, 0)
+
+    def test_rating_counters(self):
+        for access, rating, status_code in ((self.access, 5, 201), (self.access2, 2, 201), (self.access, 4, 200)):
+            response = self.client.post(
+                reverse('manhwa-rate', args=[self.manhwa.id]),
+                json.dumps({'rating': rating}),
+                content_type='application/json',
+                headers={'authorization': f'JWT {access}'}
+            )
+            self.assertEqual(response.status_code, status_code)
+
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.raters_count, 2)
+        self.assertEqual(self.manhwa.rating_sum, 6)
+        self.assertEqual((self.manhwa.fives_count, self.manhwa.fours_count, self.manhwa.twos_count), (0, 1, 1))
+
+        response = self.client.get(reverse('manhwa-detail', args=[self.manhwa.id]))
+        self.assertEqual(response.json()['rating_data']['avg_rating'], '3.0')
+
+        Rate.objects.filter(user=self.user2).delete()
+        self.manhwa.refresh_from_db()
+        self.assertEqual((self.manhwa.raters_count, self.manhwa.rating_sum, self.manhwa.twos_count), (1, 4, 0))
+
+    def test_rebuild_rating_counters_command(self):
+        Rate.objects.bulk_create([
+            Rate(user=self.user, manhwa=self.manhwa, rating=5),
+            Rate(user=self.user2, manhwa=self.manhwa, rating=3),
+        ])
+        call_command('rebuild_rating_counters', stdout=StringIO())
+
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.rating_data, {
+            'avg_rating': 4.0, 'raters_count': 2, 'fives_count': 1, 'fours_count': 0,
+            'threes_count': 1, 'twos_count': 0, 'ones_count': 0,
+        })
 
     def test_user_send_ticket(self):
         response = self.client.post(
@@ -338,7 +608,738 @@ class ManhwaApiTest(TestCase):
         self.assertEqual(response2.status_code, 403)  # post forbidden not working
 
 
-class ManhwaViewTest(TestCase):
+class ManhwaOrderingTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(phone_number=f'0912345678{i}', username=f'user{i}', password='pass1234')
+            for i in range(3)
+        ]
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwas = [
+            Manhwa.objects.create(
+                en_title=f'manhwa{i}',
+                summary='summary',
+                day_of_week=Manhwa.SATURDAY,
+                cover=get_image(),
+                publication_datetime=timezone.now(),
+                studio=cls.studio,
+            )
+            for i in range(4)
+        ]
+        # avg ratings: 4.0, 2.0, 4.0, 0
+        for manhwa, ratings in zip(cls.manhwas, ((5, 3), (2,), (4, 4, 4))):
+            for user, rating in zip(cls.users, ratings):
+                Rate.objects.set_rating(user, manhwa.id, rating)
+
+    def test_ordering_by_avg_rating(self):
+        response = self.client.get(reverse('manhwa-list'), {'ordering': '-avg_rating'})
+        ids = [manhwa['id'] for manhwa in response.json()['results']]
+        m = self.manhwas
+        self.assertEqual(ids, [m[2].id, m[0].id, m[1].id, m[3].id])  # same avg, ordered by id
+
+        response = self.client.get(reverse('manhwa-list'), {'ordering': 'avg_rating'})
+        ids = [manhwa['id'] for manhwa in response.json()['results']]
+        self.assertEqual(ids, [m[3].id, m[1].id, m[0].id, m[2].id])
+
+    def test_rating_counters_kept_by_plain_save(self):
+        # admin & shell save rates without set_rating
+        m = self.manhwas
+        rate = Rate.objects.get(manhwa=m[1])
+        rate.rating = 4
+        rate.save()
+        rate = Rate.objects.only('id').get(pk=rate.pk)  # manhwa & rating deferred
+        rate.manhwa = m[3]
+        rate.save()
+        Rate(user=self.users[1], manhwa=m[3], rating=2).save()
+
+        counters = ('rating_sum', 'raters_count', 'fours_count', 'twos_count', 'avg_rating')
+        self.assertEqual(Manhwa.objects.values_list(*counters).get(pk=m[1].pk), (0, 0, 0, 0, 0))
+        self.assertEqual(Manhwa.objects.values_list(*counters).get(pk=m[3].pk), (6, 2, 1, 1, 3.0))
+        stored = list(Manhwa.objects.order_by('id').values_list(*counters))
+        Rate.objects.sync_manhwa_rating_counters()
+        self.assertEqual(list(Manhwa.objects.order_by('id').values_list(*counters)), stored)
+
+    def test_manhwa_cursor_pagination(self):
+        Manhwa.objects.filter(pk=self.manhwas[1].id).update(views_count=10)
+        response = self.client.get(reverse('manhwa-list'), {'pagination': 'cursor', 'ordering': '-views_count'})
+        data = response.json()
+
+        self.assertNotIn('count', data)
+        self.assertEqual(data['results'][0]['id'], self.manhwas[1].id)
+
+    def test_manhwa_cursor_pagination_in_ties(self):
+        # all manhwas have same views_count, pages are cut by id without offsets
+        url = reverse('manhwa-list') + '?pagination=cursor&ordering=-views_count'
+        ids, links = [], []
+        with patch.object(ManhwaCursorPagination, 'page_size', 3):
+            while url:
+                data = self.client.get(url).json()
+                ids += [manhwa['id'] for manhwa in data['results']]
+                links.append(data['previous'])
+                url = data['next']
+            self.assertNotIn('o%3D', links[-1])
+            previous = self.client.get(links[-1]).json()
+
+        self.assertEqual(ids, sorted((manhwa.id for manhwa in self.manhwas), reverse=True))
+        self.assertEqual([manhwa['id'] for manhwa in previous['results']], ids[:3])
+        self.assertEqual(self.client.get(reverse('manhwa-list'), {'pagination': 'cursor', 'cursor': 'bad'}).status_code, 404)
+
+    def test_manhwa_list_comments_count_queries(self):
+        user = self.users[0]
+        for manhwa in self.manhwas[:2]:
+            Comment.objects.create(author=user, manhwa=manhwa, text='first comment')
+            Comment.objects.create(author=user, manhwa=manhwa, text='second comment')
+        Comment.objects.filter(manhwa=self.manhwas[1], text='first comment').delete()
+
+        with self.assertNumQueries(2):  # count, page
+            response = self.client.get(reverse('manhwa-list'), {'ordering': 'publication_datetime'})
+
+        counts = [manhwa['comments_count'] for manhwa in response.json()['results']]
+        self.assertEqual(counts, [2, 1, 0, 0])
+
+    def test_avg_rating_ordering_query_plan(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('manhwa-list'), {'ordering': '-avg_rating', 'page': 1})
+
+        for query in ctx.captured_queries:
+            self.assertNotIn('manhwas_rate', query['sql'])  # no join or aggregate over rates
+            self.assertNotIn('GROUP BY', query['sql'])
+
+        if connection.vendor == 'sqlite':
+            ordered = Manhwa.objects.order_by('-avg_rating', '-id')
+            for page in (ordered[:10], ordered[10000:10010]):  # first & deep page
+                plan = page.explain()
+                self.assertIn('manhwas_man_avg_rat_a39322_idx', plan)
+                self.assertNotIn('TEMP B-TREE', plan)  # no sort step
+
+
+class HomePageTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='09123456789', username='mohsen', password='pass1234')
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwas = [
+            Manhwa.objects.create(
+                en_title=f'home manhwa {i}',
+                summary='summary',
+                day_of_week=Manhwa.SATURDAY,
+                cover=get_image(),
+                publication_datetime=timezone.now(),
+                studio=cls.studio,
+            )
+            for i in range(HomeCursorPagination.page_size + 1)
+        ]
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_home_page_paginated(self):
+        response = self.client.get(reverse('home'))
+        next_link = unescape(search(r'href="([^"]*cursor=[^"]*)"', response.context['grid']).group(1))
+
+        self.assertNotContains(response, self.manhwas[0].en_title + '<')  # oldest one is in next page
+        self.assertContains(response, self.manhwas[-1].en_title)
+
+        response = self.client.get(next_link)
+        self.assertContains(response, self.manhwas[0].en_title + '<')
+
+    def test_home_page_invalid_cursor(self):
+        response = self.client.get(reverse('home'), {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_home_grid_cache(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+
+        # rating change invalidates grid
+        Rate.objects.set_rating(self.user, self.manhwas[-1].id, 3)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, '3.0')
+
+
+class ManhwaDetailCacheTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='09123456789', username='user', password='pass1234')
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.genre = Genre.objects.create(title='action', description='genre description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='cached manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.url = reverse('manhwa-detail', args=[self.manhwa.id])
+
+    def test_api_detail_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['en_title'], 'cached manhwa')
+        self.assertEqual(cache_metrics()[MANHWA_DETAIL], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_home_grid_invalidated_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Rate.objects.set_rating(self.user, self.manhwa.id, 4)
+            version = get_version(HOME_GRID)  # a grid cached now has old avg_rating of other transactions
+
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_version(HOME_GRID), version)
+
+    def test_api_detail_invalidated(self):
+        self.client.get(self.url)
+
+        Rate.objects.set_rating(self.user, self.manhwa.id, 4)
+        self.assertEqual(self.client.get(self.url).json()['rating_data']['avg_rating'], '4.0')
+
+        Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('episode.pdf', b'pdf'))
+        self.assertEqual(self.client.get(self.url).json()['last_upload'], 'S01-E01')
+
+        self.manhwa.genres.add(self.genre)
+        self.assertEqual(self.client.get(self.url).json()['genres'], ['action'])
+
+        self.genre.manhwas.remove(self.manhwa)  # reverse side of genres
+        self.assertEqual(self.client.get(self.url).json()['genres'], [])
+
+        Comment.objects.create(author=self.user, manhwa=self.manhwa, text='new comment')
+        self.assertEqual(self.client.get(self.url).json()['comments_count'], 1)
+
+    def test_detail_page_cached(self):
+        self.client.get(reverse('manhwa_detail', args=[self.manhwa.id]))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('manhwa_detail', args=[self.manhwa.id]))
+        self.assertContains(response, 'cached manhwa')
+        self.assertContains(response, 'csrfmiddlewaretoken')  # comment form is not cached
+
+        self.manhwa.genres.add(self.genre)
+        self.assertContains(self.client.get(reverse('manhwa_detail', args=[self.manhwa.id])), 'action')
+
+
+class EpisodeNumberingTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='numbered manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+            season=2,
+        )
+
+    def create_episode(self):
+        return Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('episode.pdf', b'pdf'))
+
+    def test_numbers_given_on_insert(self):
+        first = self.create_episode()
+        with self.assertNumQueries(4):  # savepoint, reserve number & last_upload, insert, release
+            second = self.create_episode()
+
+        self.assertEqual((first.number, second.number), (1, 2))
+        self.manhwa.refresh_from_db()
+        self.assertEqual((self.manhwa.last_upload, self.manhwa.next_episode_number), ('S02-E02', 3))
+
+        first.file = SimpleUploadedFile('fixed.pdf', b'pdf')
+        first.save()  # edit keeps number
+        first.refresh_from_db()
+        self.assertEqual(first.number, 1)
+
+    def test_plain_save_keeps_counters(self):
+        # admin change form & shell save a manhwa loaded before counters & numbers changed
+        manhwa = Manhwa.objects.get(pk=self.manhwa.pk)
+        self.create_episode()
+        Manhwa.objects.filter(pk=manhwa.pk).update(views_count=3, comments_count=2)
+        manhwa.en_title = 'renamed manhwa'
+        manhwa.save()
+
+        manhwa.refresh_from_db()
+        self.assertEqual(manhwa.en_title, 'renamed manhwa')
+        self.assertEqual((manhwa.views_count, manhwa.comments_count), (3, 2))
+        self.assertEqual((manhwa.next_episode_number, manhwa.last_upload), (2, 'S02-E01'))
+        self.assertEqual(self.create_episode().number, 2)
+
+    def test_reserve_numbers(self):
+        self.assertEqual(Episode.objects.reserve_numbers(self.manhwa.id, count=10), 1)
+        self.assertEqual(Episode.objects.reserve_numbers(self.manhwa.id), 11)
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.last_upload, 'S02-E11')
+
+        with self.assertRaises(Manhwa.DoesNotExist):
+            Episode.objects.reserve_numbers(self.manhwa.id + 100)
+
+    def test_reserve_numbers_without_returning(self):
+        with patch('manhwas.models.supports_update_returning', return_value=False):
+            self.assertEqual(Episode.objects.reserve_numbers(self.manhwa.id, count=2), 1)
+            self.assertEqual(self.create_episode().number, 3)
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.last_upload, 'S02-E03')
+
+
+class IngestEpisodesTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='ingested manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+        )
+
+    def setUp(self) -> None:
+        use_temp_dirs(self, 'MEDIA_ROOT')  # storage of each test is empty
+
+        self.source = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        for name in ('ep-10.pdf', 'ep-2.pdf', 'ep-1.pdf', '.DS_Store'):
+            with open(os.path.join(self.source, name), 'wb') as file:
+                file.write(name.encode() * 100)
+
+    def test_ingest_directory(self):
+        Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('old.pdf', b'pdf'))
+        out = StringIO()
+        call_command('ingest_episodes', self.manhwa.id, self.source, stdout=out)
+
+        self.assertIn('3 files, 3 uploaded, 3 episodes added (episodes 2-4)', out.getvalue())
+        episodes = Episode.objects.filter(manhwa=self.manhwa, number__gt=1)
+        self.assertEqual([os.path.basename(episode.file.name) for episode in episodes], ['ep-1.pdf', 'ep-2.pdf', 'ep-10.pdf'])
+        self.assertEqual(episodes[2].file.read(), b'ep-10.pdf' * 100)
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.last_upload, 'S01-E04')
+
+    def test_interrupted_ingest_resumed(self):
+        # ep-1 uploaded, ep-2 partially uploaded, no episode added
+        episode = Episode(manhwa=self.manhwa)
+        field = Episode._meta.get_field('file')
+        default_storage.save(field.generate_filename(episode, 'ep-1.pdf'), ContentFile(b'ep-1.pdf' * 100))
+        default_storage.save(field.generate_filename(episode, 'ep-2.pdf'), ContentFile(b'ep-2'))
+
+        result = ingest_episodes(self.manhwa, self.source)
+        self.assertEqual((result['uploaded'], result['created'], result['last_number']), (2, 3, 3))
+        self.assertEqual(Episode.objects.get(manhwa=self.manhwa, number=2).file.size, 800)
+
+        result = ingest_episodes(self.manhwa, self.source)  # run again: nothing added twice
+        self.assertEqual((result['uploaded'], result['created']), (0, 0))
+        self.assertEqual(Episode.objects.filter(manhwa=self.manhwa).count(), 3)
+
+    def test_file_of_episode_not_replaced(self):
+        old = Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('ep-1.pdf', b'old episode'))
+
+        result = ingest_episodes(self.manhwa, self.source)
+        self.assertEqual((result['uploaded'], result['created']), (3, 3))
+        old.refresh_from_db()
+        self.assertEqual(old.file.read(), b'old episode')
+        new = Episode.objects.get(manhwa=self.manhwa, number=2)
+        self.assertNotEqual(new.file.name, old.file.name)
+        self.assertEqual(new.file.read(), b'ep-1.pdf' * 100)
+
+        # same name & size, other content: a new episode
+        with open(os.path.join(self.source, 'ep-2.pdf'), 'wb') as file:
+            file.write(b'EP-2.PDF' * 100)
+        result = ingest_episodes(self.manhwa, self.source)
+        self.assertEqual((result['created'], result['first_number']), (1, 5))
+
+    def test_admin_upload_archive(self):
+        admin = CustomUser.objects.create_superuser(phone_number='09123456789', username='admin', password='pass1234')
+        self.client.force_login(admin)
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('season/ep-2.pdf', b'two')
+            zip_file.writestr('season/ep-1.pdf', b'one')
+            zip_file.writestr('__MACOSX/season/._ep-1.pdf', b'meta')
+
+        url = reverse('admin:manhwas_manhwa_changelist')
+        response = self.client.post(url, {
+            'action': 'upload_episodes', helpers.ACTION_CHECKBOX_NAME: [self.manhwa.id], 'apply': '1',
+            'archive': SimpleUploadedFile('season.zip', archive.getvalue(), content_type='application/zip'),
+        })
+
+        self.assertEqual(response.status_code, 302)
+        episodes = Episode.objects.filter(manhwa=self.manhwa)
+        self.assertEqual([(episode.number, episode.file.read()) for episode in episodes], [(1, b'one'), (2, b'two')])
+
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('a/ep-3.pdf', b'three')
+            zip_file.writestr('b/ep-3.pdf', b'other three')
+        response = self.client.post(url, {
+            'action': 'upload_episodes', helpers.ACTION_CHECKBOX_NAME: [self.manhwa.id], 'apply': '1',
+            'archive': SimpleUploadedFile('season.zip', archive.getvalue(), content_type='application/zip'),
+        }, follow=True)
+        self.assertContains(response, 'File names of episodes are not unique.')
+        self.assertEqual(Episode.objects.filter(manhwa=self.manhwa).count(), 2)
+
+
+class EpisodeDownloadTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='downloaded manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+        )
+
+    def setUp(self) -> None:
+        use_temp_dirs(self, 'MEDIA_ROOT', 'VIEW_BUFFER_DIR')
+
+        self.content = bytes(range(256)) * 1000
+        self.episode = Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('ep.pdf', self.content))
+        self.url = reverse('manhwa-episodes-download', args=[self.manhwa.id, self.episode.id])
+
+    def test_download_counted_in_batch(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+            self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        self.client.get(self.url)
+        self.client.get(self.url, headers={'Range': 'bytes=1000-'})  # rest of a resumed download
+        self.assertEqual(flush_downloads(grace=0), 2)
+        self.episode.refresh_from_db()
+        self.assertEqual(self.episode.downloads_count, 2)
+
+    def test_range(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=1000-1999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[1000:2000])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        # file changed since If-Range validator, whole file is sent
+        response = self.client.get(self.url, headers={'Range': 'bytes=1000-', 'If-Range': '"old"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_episode_serializer_has_download_url(self):
+        response = self.client.get(reverse('manhwa-episodes-list', args=[self.manhwa.id]))
+        self.assertEqual(response.json()[0]['download'], 'http://testserver' + self.url)
+        self.assertEqual(response.json()[0]['file'], 'http://testserver' + self.url)  # no raw media url
+
+
+class ConditionalRequestsTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(phone_number='09123456789', username='user', password='pass1234')
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.genre = Genre.objects.create(title='action', description='genre description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='polled manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+        )
+        Episode.objects.create(manhwa=cls.manhwa, file=SimpleUploadedFile('episode.pdf', b'pdf'))
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_episode_list_not_modified(self):
+        url = reverse('manhwa-episodes-list', args=[self.manhwa.id])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):  # same query as a full response, no serialization
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('episode.pdf', b'pdf'))
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_manhwa_list_etag_changes_with_counters_and_genres(self):
+        url = reverse('manhwa-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        Rate.objects.set_rating(self.user, self.manhwa.id, 5)  # counters don't change datetime_modified
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        self.manhwa.genres.add(self.genre)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_manhwa_list_etag_changes_with_counters_of_other_processes(self):
+        # e.g. views_count by flush_views worker, no cache is shared with it
+        url = reverse('manhwa-list')
+        etag = self.client.get(url)['ETag']
+        Manhwa.objects.filter(pk=self.manhwa.pk).update(views_count=F('views_count') + 1)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_manhwa_detail_not_modified(self):
+        # counters change without datetime_modified, so manhwa details have no Last-Modified
+        url = reverse('manhwa-detail', args=[self.manhwa.id])
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_episode_detail_not_modified_since(self):
+        episode = self.manhwa.episodes.get()
+        url = reverse('manhwa-episodes-detail', args=[self.manhwa.id, episode.id])
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Last-Modified'], last_modified)
+
+
+class ViewBufferTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(phone_number=f'0912345678{i}', username=f'user{i}', password='pass1234')
+            for i in range(3)
+        ]
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='hot manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+        )
+
+    def setUp(self) -> None:
+        use_temp_dirs(self, 'VIEW_BUFFER_DIR')
+
+    def test_buffered_views_flushed_once_per_user(self):
+        other = Manhwa.objects.create(
+            en_title='other manhwa', summary='summary', day_of_week=Manhwa.SUNDAY, cover=self.manhwa.cover,
+            publication_datetime=timezone.now(), studio=self.studio,
+        )
+        View.objects.create(user=self.users[0], manhwa=self.manhwa)  # viewed before
+        View.objects.create(user=self.users[1], manhwa=other)
+        for user in self.users * 3:
+            record_view(user.id, self.manhwa.id)
+            record_view(user.id, other.id)
+        record_view(self.users[0].id, self.manhwa.id + 100)  # not existing manhwa
+
+        # users, manhwas, existing views of all manhwas, insert, update + savepoint, release
+        with self.assertNumQueries(7):
+            created = flush_views(batch_size=100, grace=0)
+
+        self.manhwa.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(created, 4)
+        self.assertEqual((self.manhwa.views_count, other.views_count), (2, 2))
+        self.assertEqual(flush_views(grace=0), 0)  # buffer is empty
+
+
+class RequestProfilingTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwa = Manhwa.objects.create(
+            en_title='profiled manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=get_image(),
+            publication_datetime=timezone.now(),
+            studio=cls.studio,
+        )
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "a" FROM "t"  WHERE "id" IN (%s, %s, %s) AND "name" = \'x\' LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "id" IN (...) AND "name" = ? LIMIT ?'
+        )
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1, REQUEST_PROFILING_SERVER_TIMING=True)
+    def test_profiled_request_logged(self):
+        with self.assertLogs('manhwas.profiling', level='INFO') as logs:
+            response = self.client.get(reverse('manhwa-list'))
+
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual((data['view'], data['status'], data['queries']), ('manhwa-list', 200, 2))
+        self.assertEqual(len(data['slowest']), 2)
+        self.assertGreater(data['render_ms'], 0)  # json rendering of drf response
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1, REQUEST_PROFILING_VIEWS=['manhwa-detail'])
+    def test_views_not_in_allowlist_not_profiled(self):
+        with self.assertNoLogs('manhwas.profiling'):
+            response = self.client.get(reverse('manhwa-list'))
+        self.assertNotIn('Server-Timing', response)
+
+        with self.assertLogs('manhwas.profiling', level='INFO'):
+            self.client.get(reverse('manhwa-detail', args=[self.manhwa.id]))
+
+    def test_profiling_off_by_default(self):
+        with self.assertNoLogs('manhwas.profiling'):
+            self.client.get(reverse('manhwa-list'))
+
+    def test_repeated_queries_detected(self):
+        with self.assertRaises(RepeatedQueriesError) as error:
+            with assert_no_repeated_queries(threshold=2):
+                for _ in range(3):
+                    Manhwa.objects.get(pk=self.manhwa.id)
+        self.assertIn('3x manhwas/tests.py', str(error.exception))
+
+    def test_lists_without_repeated_queries(self):
+        user = CustomUser.objects.create_user(phone_number='09123456789', username='user', password='pass1234')
+        for i in range(5):
+            comment = Comment.objects.create(author=user, manhwa=self.manhwa, text=f'comment {i}')
+            Comment.objects.create(author=user, manhwa=self.manhwa, text=f'reply {i}', parent=comment)
+            Manhwa.objects.create(
+                en_title=f'manhwa {i}', summary='summary', day_of_week=Manhwa.SUNDAY,
+                cover=self.manhwa.cover, publication_datetime=timezone.now(), studio=self.studio,
+            )
+
+        requests = (
+            (reverse('manhwa-list'), {}),
+            (reverse('manhwa-comments-list', args=[self.manhwa.id]), {}),
+            (reverse('home'), {}),
+            (reverse('manhwa_detail', args=[self.manhwa.id]), {'Tab-Load': 'comments'}),
+        )
+        for url, headers in requests:
+            with assert_no_repeated_queries(threshold=1):
+                self.client.get(url, headers=headers)
+
+    @override_settings(N_PLUS_ONE_DETECTION='log', N_PLUS_ONE_THRESHOLD=0)
+    def test_repeated_queries_logged(self):
+        with self.assertLogs('manhwas.nplusone', level='WARNING') as logs:
+            self.client.get(reverse('manhwa-list'))
+
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['view'], 'manhwa-list')
+        self.assertEqual(data['repeated'][0]['count'], 1)
+        self.assertIn('manhwas/', data['repeated'][0]['call_site'])
+
+
+class BenchRoutesTest(TestCase):
+    def test_query_bounds_of_all_routes(self):
+        # fails if any route runs more queries than its bound in bench_routes.ROUTES
+        out = StringIO()
+        call_command('bench_routes', '--manhwas=11', '--comments=11', '--users=3', '--requests=1', stdout=out)
+        self.assertIn('routes passed', out.getvalue())
+        self.assertFalse(Manhwa.objects.exists())  # dataset rolled back
+
+
+class SeedDataTest(TestCase):
+    def setUp(self):
+        use_temp_dirs(self, 'MEDIA_ROOT')
+
+    def test_seeded_counters_are_right(self):
+        call_command('seed_data', '--users=20', '--manhwas=3', '--episodes=2', '--rates=30', '--views=40',
+                     '--comments=10', '--chunk-size=7', stdout=StringIO())
+
+        self.assertEqual(Manhwa.objects.count(), 3)
+        self.assertEqual(Rate.objects.count(), 30)
+        self.assertEqual(Comment.objects.filter(level=0).count(), 10)
+        for manhwa in Manhwa.objects.all():
+            self.assertEqual(manhwa.comments_count, manhwa.comments.count())
+            self.assertEqual(manhwa.raters_count, manhwa.rates.count())
+        for comment in Comment.objects.all():
+            self.assertEqual(comment.replies_count, comment.children.count())
+
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('0 comments drifted', out.getvalue())
+        self.assertIn('0 manhwas drifted', out.getvalue())
+
+    def test_second_run_adds_users(self):
+        call_command('seed_data', '--users=3', '--manhwas=1', '--episodes=1', '--rates=2', '--views=2',
+                     '--comments=1', stdout=StringIO())
+        call_command('seed_data', '--users=3', '--manhwas=1', '--episodes=1', '--rates=2', '--views=2',
+                     '--comments=1', stdout=StringIO())
+
+        self.assertEqual(CustomUser.objects.count(), 6)
+        self.assertEqual(Manhwa.objects.count(), 2)
+        self.assertTrue(CustomUser.objects.filter(phone_number='09800000005', username='seed-user-5').exists())
+
+
+class ReconcileCountersTest(TempMediaTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(phone_number=f'0912345678{i}', username=f'user{i}', password='pass1234')
+            for i in range(3)
+        ]
+        cls.studio = Studio.objects.create(title='studio title', description='studio description.')
+        cls.manhwas = [
+            Manhwa.objects.create(
+                en_title=f'manhwa {i}',
+                summary='summary',
+                day_of_week=Manhwa.SATURDAY,
+                cover=get_image(),
+                publication_datetime=timezone.now(),
+                studio=cls.studio,
+            ) for i in range(2)
+        ]
+        cls.comments = [
+            Comment.objects.create(author=cls.users[0], manhwa=manhwa, text='comment') for manhwa in cls.manhwas
+        ]
+        for comment in cls.comments:
+            for user, reaction in zip(cls.users, ['lk', 'lk', 'dlk']):
+                CommentReAction.objects.toggle_reaction(user=user, comment_id=comment.id, reaction=reaction)
+            View.objects.create(user=cls.users[0], manhwa=comment.manhwa)
+
+        Comment.objects.update(likes_count=7, dis_likes_count=0)
+        Manhwa.objects.update(views_count=5)
+
+    def test_dry_run_reports_drift(self):
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+
+        self.assertIn('2 comments drifted (likes_count: 10, dis_likes_count: 2)', out.getvalue())
+        self.assertIn('2 manhwas drifted (views_count: 8)', out.getvalue())
+        self.assertEqual(Comment.objects.get(pk=self.comments[0].pk).likes_count, 7)
+
+    def test_counters_fixed_in_manhwa_range(self):
+        manhwa = self.manhwas[0]
+        call_command('reconcile_counters', f'--manhwa-from={manhwa.id}', f'--manhwa-to={manhwa.id}',
+                     '--chunk-size=1', stdout=StringIO())
+
+        fixed, untouched = (Comment.objects.get(pk=comment.pk) for comment in self.comments)
+        self.assertEqual((fixed.likes_count, fixed.dis_likes_count), (2, 1))
+        self.assertEqual((untouched.likes_count, untouched.dis_likes_count), (7, 0))
+        self.assertEqual(Manhwa.objects.get(pk=manhwa.pk).views_count, 1)
+        self.assertEqual(Manhwa.objects.get(pk=self.manhwas[1].pk).views_count, 5)
+
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', f'--manhwa-to={manhwa.id}', stdout=out)
+        self.assertIn('0 comments drifted', out.getvalue())
+
+    def test_counters_clamped_at_zero(self):
+        # shards with more likes than real reactions, e.g. of reactions removed without a delta
+        comment = self.comments[0]
+        CommentReactionCounterShard.objects.create(comment=comment, shard=0, likes=5, dis_likes=1)
+        call_command('reconcile_counters', stdout=StringIO())
+
+        comment.refresh_from_db()
+        self.assertEqual((comment.likes_count, comment.dis_likes_count), (0, 0))
+
+
+class ManhwaViewTest(TempMediaTestCase):
 
     @classmethod
     def setUpTestData(cls):
@@ -392,8 +1393,46 @@ class ManhwaViewTest(TestCase):
         self.assertNotContains(response, self.new_comment.text)
         self.assertNotContains(response, comment.text)
 
+    def test_manhwa_detail_page_queries_not_depend_on_rates(self):
+        cache.clear()
+        Rate.objects.set_rating(self.user, self.manhwa.id, 4)
+        url = reverse('manhwa_detail', args=[self.manhwa.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
 
-class ManhwaUrlTest(TestCase):
+        self.assertContains(response, '4.0 (1 ')  # rating summary from counters
+        self.assertFalse([query for query in ctx.captured_queries if 'manhwas_rate' in query['sql']])
+        self.assertFalse([query for query in ctx.captured_queries if 'manhwas_episode' in query['sql']])
+
+    def test_manhwa_detail_episodes_tab(self):
+        with patch('manhwas.paginations.EpisodeCursorPagination.page_size', 2):
+            for _ in range(3):
+                Episode.objects.create(manhwa=self.manhwa, file=SimpleUploadedFile('episode.pdf', b'pdf'))
+
+            response = self.client.get(reverse('manhwa_detail', args=[self.manhwa.id]), headers={'Tab-Load': 'episodes'})
+            data = response.json()
+            self.assertIn('Episode : 2', data['html'])
+            self.assertNotIn('Episode : 3', data['html'])
+
+            data = self.client.get(data['next'], headers={'Tab-Load': 'episodes'}).json()
+            self.assertIn('Episode : 3', data['html'])
+            self.assertIsNone(data['next'])
+
+    def test_manhwa_detail_comments_tab(self):
+        CommentReAction.objects.toggle_reaction(self.user, self.new_comment.id, CommentReAction.LIKE)
+
+        response = self.client.get(
+            reverse('manhwa_detail', args=[self.manhwa.id]),
+            headers={'Tab-Load': 'comments'}
+        )
+        html = response.json()['html']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.new_comment.text, html)
+        self.assertIn('icon-like active', html)  # session user reaction not lost
+
+
+class ManhwaUrlTest(TempMediaTestCase):
     @classmethod
     def setUpTestData(cls):
         cls.user = CustomUser.objects.create_user(
@@ -420,6 +1459,8 @@ class ManhwaUrlTest(TestCase):
         )
 
     def setUp(self) -> None:
+        use_temp_dirs(self, 'VIEW_BUFFER_DIR')
+
         self.manhwa = Manhwa.objects.create(
             en_title='manhwa1',
             summary='manhwa1 summary',
@@ -513,7 +1554,7 @@ class ManhwaUrlTest(TestCase):
             content_type='application/json',
             headers={'authorization': f'JWT {self.access}'},
         )
-        self.assertEqual(response.status_code, 201)  # returns 201 CREATED if view is new else 200 OK
+        self.assertEqual(response.status_code, 202)  # returns 202 ACCEPTED, view saved by flush_views
 
     def test_set_user_view_url_by_name(self):
         response = self.client.post(
@@ -522,8 +1563,151 @@ class ManhwaUrlTest(TestCase):
             content_type='application/json',
             headers={'authorization': f'JWT {self.access}'},
         )
-        self.assertEqual(response.status_code, 201)  # return 201 CREATED.
+        self.assertEqual(response.status_code, 202)  # return 202 ACCEPTED.
+
+    def test_set_view_of_not_existing_manhwa(self):
+        response = self.client.post(
+            reverse('manhwa-set-view', args=[self.manhwa.id + 100]),
+            headers={'authorization': f'JWT {self.access}'},
+        )
+        self.assertEqual(response.status_code, 404)
 
     def test_GET_request_not_valid_set_user_view(self):
         response = self.client.get(reverse('manhwa-set-view', args=[self.manhwa.id]))
         self.assertEqual(response.status_code, 405)
+
+
+class CoverVariantsTest(TestCase):
+    def setUp(self) -> None:
+        use_temp_dirs(self, 'MEDIA_ROOT')
+
+        cover = BytesIO()
+        Image.new('RGB', (1000, 1500), (0, 0, 255)).save(cover, format='PNG')
+        self.manhwa = Manhwa.objects.create(
+            en_title='covered manhwa',
+            summary='summary',
+            day_of_week=Manhwa.SATURDAY,
+            cover=SimpleUploadedFile('cover.png', cover.getvalue()),
+            publication_datetime=timezone.now(),
+            studio=Studio.objects.create(title='studio title', description='studio description.'),
+        )
+        self.variants_dir = os.path.join(os.path.dirname(self.manhwa.cover.path), 'variants')
+
+    def process_covers(self):
+        out = StringIO()
+        call_command('process_covers', workers=0, stdout=out, stderr=StringIO())
+        return out.getvalue().strip()
+
+    def test_variants_made_once(self):
+        response = self.client.get(reverse('manhwa-detail', args=[self.manhwa.id]))
+        self.assertEqual(response.json()['cover_srcset'], {})
+
+        self.assertEqual(self.process_covers(), '1 covers processed.')
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.cover_variants, {image_format: [200, 400, 600] for image_format in COVER_FORMATS})
+        with Image.open(os.path.join(self.variants_dir, 'cover-400w.webp')) as image:
+            self.assertEqual(image.size, (400, 600))
+
+        srcset = self.client.get(reverse('manhwa-list')).json()['results'][0]['cover_srcset']
+        self.assertEqual(
+            srcset['webp'],
+            ', '.join(f'/media/{os.path.dirname(self.manhwa.cover.name)}/variants/cover-{width}w.webp {width}w'
+                      for width in (200, 400, 600))
+        )
+        self.assertContains(self.client.get(reverse('home')), f'srcset="{srcset["webp"]}"')
+
+        self.assertFalse(pending_covers().exists())
+        self.assertEqual(self.process_covers(), '0 covers processed.')
+
+    def test_interrupted_run_is_continued(self):
+        self.process_covers()
+        kept = os.path.join(self.variants_dir, 'cover-200w.webp')
+        kept_mtime = os.stat(kept).st_mtime_ns
+        os.remove(os.path.join(self.variants_dir, 'cover-600w.jpeg'))
+        Manhwa.objects.filter(pk=self.manhwa.pk).update(cover_variants_source='')
+
+        self.assertEqual(self.process_covers(), '1 covers processed.')
+        self.assertTrue(os.path.exists(os.path.join(self.variants_dir, 'cover-600w.jpeg')))
+        self.assertEqual(os.stat(kept).st_mtime_ns, kept_mtime)
+        self.assertEqual(len(os.listdir(self.variants_dir)), 3 * len(COVER_FORMATS))
+
+    def test_storage_error_retried(self):
+        with patch('manhwas.covers.make_cover_variants', side_effect=ConnectionError('storage is down')), \
+                self.assertLogs('manhwas.covers', 'WARNING'):
+            self.assertEqual(self.process_covers(), '0 covers processed.')
+        self.assertTrue(pending_covers().exists())
+
+        self.assertEqual(self.process_covers(), '1 covers processed.')
+        self.assertFalse(pending_covers().exists())
+
+    def test_changed_small_or_broken_cover(self):
+        self.process_covers()
+        self.manhwa.cover = get_image()  # 100px wide, not enlarged
+        self.manhwa.save()
+        self.assertEqual(self.manhwa.cover_srcsets, {})  # variants of old cover are not used
+
+        self.process_covers()
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.cover_variants, {image_format: [100] for image_format in COVER_FORMATS})
+
+        self.manhwa.cover = SimpleUploadedFile('broken.jpg', b'not an image')
+        self.manhwa.save()
+        with self.assertLogs('manhwas.covers', 'WARNING'):
+            self.assertEqual(self.process_covers(), '1 covers processed.')
+        self.manhwa.refresh_from_db()
+        self.assertEqual(self.manhwa.cover_srcsets, {})
+        self.assertFalse(pending_covers().exists())
+
+    def test_placeholder_made_on_upload(self):
+        self.assertEqual(self.manhwa.cover_color, '#0000ff')
+        prefix = 'data:image/webp;base64,'
+        self.assertTrue(self.manhwa.cover_placeholder.startswith(prefix))
+        with Image.open(BytesIO(base64.b64decode(self.manhwa.cover_placeholder[len(prefix):]))) as image:
+            self.assertEqual(image.size, (16, 24))
+
+        data = self.client.get(reverse('manhwa-list')).json()['results'][0]
+        self.assertEqual((data['cover_placeholder'], data['cover_color']), (self.manhwa.cover_placeholder, '#0000ff'))
+        self.assertContains(self.client.get(reverse('home')), f'#0000ff url({self.manhwa.cover_placeholder})')
+
+        self.manhwa.cover = SimpleUploadedFile('broken.jpg', b'not an image')
+        self.manhwa.save()
+        self.assertEqual((self.manhwa.cover_placeholder, self.manhwa.cover_color), ('', ''))
+
+    def test_placeholder_reset_when_cover_changes(self):
+        cover = BytesIO()
+        Image.new('RGB', (100, 100), (255, 0, 0)).save(cover, format='PNG')
+        self.manhwa.cover = SimpleUploadedFile('bomb.png', cover.getvalue())
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 10):  # DecompressionBombError
+            self.manhwa.save()
+        self.assertEqual((self.manhwa.cover_placeholder, self.manhwa.cover_color), ('', ''))
+
+        Manhwa.objects.update(cover_placeholder='placeholder', cover_color='#ffffff')
+        manhwa = Manhwa.objects.get(pk=self.manhwa.pk)
+        manhwa.cover = 'Manhwa/other.jpg'  # a stored file
+        manhwa.save(update_fields=['cover'])
+        manhwa = Manhwa.objects.get(pk=self.manhwa.pk)
+        self.assertEqual((manhwa.cover_placeholder, manhwa.cover_color), ('', ''))
+
+        Manhwa.objects.update(cover_placeholder='placeholder', cover_color='#ffffff')
+        manhwa = Manhwa.objects.get(pk=self.manhwa.pk)
+        manhwa.save()  # cover not changed
+        self.assertEqual(Manhwa.objects.get(pk=manhwa.pk).cover_placeholder, 'placeholder')
+
+        manhwa.cover = None  # cleared
+        manhwa.save()
+        manhwa = Manhwa.objects.get(pk=self.manhwa.pk)
+        self.assertEqual((manhwa.cover_placeholder, manhwa.cover_color), ('', ''))
+
+    def test_backfill_placeholders(self):
+        placeholder = self.manhwa.cover_placeholder
+        Manhwa.objects.update(cover_placeholder='', cover_color='')
+
+        out = StringIO()
+        call_command('backfill_cover_placeholders', workers=0, batch_size=1, stdout=out)
+        self.assertIn('1 placeholders made.', out.getvalue())
+        self.manhwa.refresh_from_db()
+        self.assertEqual((self.manhwa.cover_placeholder, self.manhwa.cover_color), (placeholder, '#0000ff'))
+
+        out = StringIO()
+        call_command('backfill_cover_placeholders', workers=0, stdout=out)
+        self.assertIn('0 placeholders made.', out.getvalue())
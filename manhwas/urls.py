@@ -16,6 +16,8 @@ urlpatterns = [
 
     path('api/tickets/', views.TicketApiView.as_view(), name='tickets'),
     path('api/tickets/<int:pk>/', views.TicketMessagesApiView.as_view(), name='ticket-messages'),
+    path('api/comment-reactions/batch/', views.CommentReactionBatchApiView.as_view(), name='comment-reactions-batch'),
+    path('api/manhwas/<int:manhwa_pk>/episodes/<int:pk>/download/', views.episode_download, name='manhwa-episodes-download'),
 
     path('api/', include(router.urls)),
     path('api/', include(manhwa_router.urls)),
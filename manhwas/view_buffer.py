@@ -0,0 +1,129 @@
+"""
+write-behind buffer of manhwa views and episode downloads.
+
+requests only append "user_id manhwa_id" (views) or "episode_id" (downloads) lines to an append-only file
+(no db write, no row lock), flush_views command saves them to db in batches, one counter UPDATE per batch.
+"""
+import fcntl
+import glob
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Episode, View
+
+ACTIVE_FILE = 'views.log'
+SEGMENT_PATTERN = 'segment-*.log'
+DOWNLOADS_ACTIVE_FILE = 'downloads.log'
+DOWNLOADS_SEGMENT_PATTERN = 'downloads-segment-*.log'
+
+
+def _append(name, line):
+    path = os.path.join(settings.VIEW_BUFFER_DIR, name)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        os.makedirs(settings.VIEW_BUFFER_DIR, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    try:
+        os.write(fd, line.encode())  # one small O_APPEND write is atomic between processes
+    finally:
+        os.close(fd)
+
+
+def record_view(user_id, manhwa_id):
+    """append a view to buffer, it will be counted by flush_views"""
+    _append(ACTIVE_FILE, f'{int(user_id)} {int(manhwa_id)}\n')
+
+
+def record_download(episode_id):
+    """append a download to buffer, it will be counted by flush_downloads"""
+    _append(DOWNLOADS_ACTIVE_FILE, f'{int(episode_id)}\n')
+
+
+def read_segment(path):
+    """unique (user_id, manhwa_id) pairs of a segment file, broken lines are skipped"""
+    pairs = set()
+    with open(path) as file:
+        for line in file:
+            try:
+                user_id, manhwa_id = map(int, line.split())
+            except ValueError:
+                continue
+            pairs.add((user_id, manhwa_id))
+    return pairs
+
+
+def _rotate(directory, active_name, segment_prefix, grace):
+    """rename active file to a segment, so requests start a new file while segments are saved"""
+    active = os.path.join(directory, active_name)
+    if os.path.exists(active):
+        os.replace(active, os.path.join(directory, f'{segment_prefix}-{time.time_ns()}.log'))
+        time.sleep(grace)  # requests that opened active file before rename finish their write
+
+
+def flush_views(batch_size=1000, grace=1.0):
+    """
+    save buffered views to db, returns count of new views.
+
+    active file is renamed to a segment, so requests start a new file while segment is saved.
+    a segment is removed after all its batches saved; segments of an interrupted run are saved
+    again in next run, and already saved views are skipped by View.objects.add_views.
+    """
+    directory = settings.VIEW_BUFFER_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, 'flush.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one flusher at a time
+        _rotate(directory, ACTIVE_FILE, 'segment', grace)
+
+        created = 0
+        for segment in sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN))):
+            pairs = list(read_segment(segment))
+            for start in range(0, len(pairs), batch_size):
+                created += View.objects.add_views(pairs[start:start + batch_size])
+            os.remove(segment)
+
+        return created
+
+
+def read_downloads_segment(path):
+    """downloads count of each episode in a segment file, broken lines are skipped"""
+    counts = Counter()
+    with open(path) as file:
+        for line in file:
+            try:
+                counts[int(line)] += 1
+            except ValueError:
+                continue
+    return counts
+
+
+def flush_downloads(batch_size=1000, grace=1.0):
+    """
+    add buffered downloads to downloads_count of episodes, returns count of downloads.
+
+    downloads are not unique like views, so all batches of a segment are saved in one transaction
+    and a segment is counted again only if the run stops between commit and removing the segment.
+    """
+    directory = settings.VIEW_BUFFER_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, 'flush.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _rotate(directory, DOWNLOADS_ACTIVE_FILE, 'downloads-segment', grace)
+
+        counted = 0
+        for segment in sorted(glob.glob(os.path.join(directory, DOWNLOADS_SEGMENT_PATTERN))):
+            counts = list(read_downloads_segment(segment).items())
+            with transaction.atomic():
+                for start in range(0, len(counts), batch_size):
+                    Episode.objects.add_downloads(dict(counts[start:start + batch_size]))
+            counted += sum(count for _, count in counts)
+            os.remove(segment)
+
+        return counted
@@ -1,71 +1,106 @@
+import mimetypes
+import os.path
 from unittest import case
 
-import requests
-
+from django.conf import settings
 from django.db import transaction, connection
-from django.db.models import Avg, F, Value, Subquery, OuterRef, Prefetch
-from django.db.models.functions import Coalesce
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.template.loader import render_to_string
 from django.utils.functional import cached_property
+from django.utils.http import content_disposition_header, quote_etag
+from django.utils.translation import get_language
+from django.views.decorators.http import require_safe
 
 from rest_framework import status, mixins
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import ListCreateAPIView, RetrieveAPIView, GenericAPIView, CreateAPIView
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ReadOnlyModelViewSet, ModelViewSet
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
 from . import serializers as srilzr
-from .models import Manhwa, View, CommentReAction, Comment, Episode, Ticket, Rate
-from .paginations import CustomPagination
+from .cache import HOME_GRID, get_or_build, manhwa_detail_name
+from .conditional import ConditionalGetMixin
+from .filters import StableOrderingFilter
+from .models import Manhwa, CommentReAction, Comment, Episode, Ticket, Rate
+from .paginations import (
+    CustomPagination, HomeCursorPagination, CommentCursorPagination, ManhwaCursorPagination, EpisodeCursorPagination,
+    CursorOptInMixin,
+)
 from .permissions import IsOwnerOrAdmin
+from .services import get_comments_page, get_episodes_page, get_reply_tree, top_level_comments
+from .view_buffer import record_download, record_view
+
+
+HOME_GRID_CACHE_TIMEOUT = 60 * 10
+# detail is invalidated by signals, timeout only bounds lag of views_count (counted by flush_views)
+MANHWA_DETAIL_CACHE_TIMEOUT = 60 * 10
 
 
 def home_page(request):
-    manhwas = Manhwa.objects.only(
-        'id', 'en_title', 'season',
-        'cover', 'views_count', 'last_upload'
-    ).annotate(
-        avg_rating=Coalesce(Avg('rates__rating'), Value(0.0)),
-    ).order_by('-datetime_created')
+    # rendered grid of each page cached until a manhwa, episode or rate changed (see signals)
+    cursor = request.GET.get(HomeCursorPagination.cursor_query_param, '')
+
+    def build_grid():
+        manhwas = Manhwa.objects.only(
+            'id', 'en_title', 'season', 'datetime_created',
+            'cover', 'cover_variants', 'cover_variants_source', 'cover_placeholder', 'cover_color',
+            'views_count', 'last_upload', 'avg_rating',
+        )
+        paginator = HomeCursorPagination()
+        try:
+            page = paginator.paginate_queryset(manhwas, Request(request))
+        except NotFound:  # invalid cursor
+            raise Http404
+
+        return render_to_string(
+            '_home_grid.html',
+            context={'manhwas': page, 'next_link': paginator.get_next_link()},
+            request=request
+        )
 
-    return render(request, 'home.html', context={'manhwas': manhwas})
+    grid = get_or_build(HOME_GRID, cursor, build_grid, HOME_GRID_CACHE_TIMEOUT)
+    return render(request, 'home.html', context={'grid': grid})
 
 
 def manhwa_detail(request, pk):
-    manhwa = get_object_or_404(
-        Manhwa.objects.select_related('studio').prefetch_related(
-            'episodes', 'genres',
-            'rates',
-        ),
-        pk=pk
-    )
     # if request from AJAX
     if request.headers.get('Tab-Load') == 'comments':
-        url = request.build_absolute_uri(f'/api/manhwas/{manhwa.id}/comments/')
-        response = requests.get(url, cookies={'sessionid': request.COOKIES.get('sessionid')})
-        data = response.json()
+        manhwa = get_object_or_404(Manhwa.objects.only('id'), pk=pk)
+        data = get_comments_page(request, manhwa)
         html = render_to_string('manhwas/_comments.html', context={'comments': data.get('results'), 'manhwa_id': manhwa.id})
         return JsonResponse({'html': html})
 
-    return render(
-        request,
-        'manhwas/manhwa_detail_view.html',
-        context={
-            'manhwa': manhwa,
-        }
-      )
+    if request.headers.get('Tab-Load') == 'episodes':
+        try:
+            episodes, next_link = get_episodes_page(request, pk)
+        except NotFound:  # invalid cursor
+            raise Http404
+        html = render_to_string('manhwas/_episodes.html', context={'episodes': episodes})
+        return JsonResponse({'html': html, 'next': next_link})
+
+    def build_detail():
+        # rating summary is from stored counters and episodes are loaded by pages (Tab-Load: episodes),
+        # so memory of page doesn't grow with rates or episodes of manhwa
+        manhwa = get_object_or_404(Manhwa.objects.select_related('studio').prefetch_related('genres'), pk=pk)
+        html = render_to_string('manhwas/_manhwa_detail.html', context={'manhwa': manhwa}, request=request)
+        return {'title': manhwa.en_title, 'detail': html}
+
+    # detail & episodes sections cached until manhwa, its episodes, rates, comments or genres changed (see signals)
+    page = get_or_build(manhwa_detail_name(pk), f'page:{get_language()}', build_detail, MANHWA_DETAIL_CACHE_TIMEOUT)
+
+    return render(request, 'manhwas/manhwa_detail_view.html', context=page)
 
 
 def show_replied_comment(request, manhwa_id, comment_id):
-    url = request.build_absolute_uri(f'/api/manhwas/{manhwa_id}/comments/{comment_id}/replies/')
-    response = requests.get(url)
-    data = response.json()
+    comment = get_reply_tree(manhwa_id, comment_id, request.user)
+    data = srilzr.CommentDetailSerializer(comment).data
     return render(request, 'manhwas/comment_replies.html', context={'comment': data})
 
 
@@ -94,7 +129,7 @@ class TicketMessagesApiView(RetrieveAPIView, CreateAPIView):
 
     def post(self, request, *args, **kwargs):
         self.get_object()
-        super().post(request, *args, **kwargs)
+        return super().post(request, *args, **kwargs)
 
     def get_serializer_context(self):
         context = {'ticket': self.kwargs['pk'],}
@@ -106,8 +141,9 @@ class TicketMessagesApiView(RetrieveAPIView, CreateAPIView):
         return srilzr.CreateTicketMessageSerializer
 
 
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(CursorOptInMixin, ModelViewSet):
     pagination_class = CustomPagination
+    cursor_pagination_class = CommentCursorPagination
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     @cached_property
@@ -117,7 +153,7 @@ class CommentViewSet(ModelViewSet):
 
     def get_permissions(self):
         match self.action:
-            case 'create':
+            case 'create' | 'reaction':
                 return [IsAuthenticated()]
             case 'partial_update' | 'destroy':
                 return [IsOwnerOrAdmin()]
@@ -127,24 +163,10 @@ class CommentViewSet(ModelViewSet):
     def get_queryset(self):
         pk = self.kwargs.get('pk')
 
-        base_qs = Comment.objects.prefetch_related(
-            Prefetch(
-        'children',
-                queryset=Comment.objects.select_related('author')
-            )
-        ).select_related('author').filter(manhwa=self.manhwa)
-
         if self.action == 'list':
-            query = base_qs.filter(level=0)
-            return query if not self.request.user.is_authenticated else query.annotate(
-                user_reaction=Coalesce(
-                    Subquery(CommentReAction.objects.filter(
-                        user_id=self.request.user.id,
-                        comment_id=OuterRef('pk')
-                        ).values('reaction')),
-                    Value('no-reaction')
-                ),
-            )
+            return top_level_comments(self.manhwa, self.request.user)
+
+        base_qs = Comment.objects.with_reaction_counts().select_related('author').filter(manhwa=self.manhwa)
 
         return base_qs.filter(pk=pk)  # create, detail
 
@@ -159,46 +181,50 @@ class CommentViewSet(ModelViewSet):
             case _:
                 return srilzr.RetrieveCommentSerializer
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_comments_page(request, self.manhwa, paginator=self.paginator))
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user, manhwa=self.manhwa)
 
 
     @action(detail=True, methods=['GET'])
     def replies(self, request, manhwa_pk=None, pk=None):
-        comment_obj = self.get_object()
+        comment_obj = get_reply_tree(manhwa_pk, pk, request.user)
+        self.check_object_permissions(request, comment_obj)
         serializer = self.get_serializer(comment_obj)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
     def reaction(self, request, manhwa_pk=None, pk=None):
-        comment = self.get_object()
-        serializer = self.get_serializer(data=request.data, context={'request': request, 'comment_id': pk})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # comment of manhwa is checked by counters update of toggle, instead of get_object
+        if not (pk.isdigit() and manhwa_pk.isdigit()):
+            raise NotFound('comment not found')
 
-        comment.refresh_from_db()
-        comment_data = {'likes_count': comment.likes_count, 'dis_likes_count': comment.dis_likes_count}
+        serializer = self.get_serializer(
+            data=request.data, context={'request': request, 'comment_id': int(pk), 'manhwa_id': int(manhwa_pk)}
+        )
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save()
+        except Comment.DoesNotExist:
+            raise NotFound('comment not found')
 
-        return Response({'action': serializer.action, 'comment': comment_data, 'reaction': serializer.data}, status=status.HTTP_200_OK)
+        return Response({'action': serializer.action, 'comment': serializer.counts, 'reaction': serializer.data}, status=status.HTTP_200_OK)
 
 
-class ManhwaViewSet(ModelViewSet):
+class ManhwaViewSet(ConditionalGetMixin, CursorOptInMixin, ModelViewSet):
     pagination_class = CustomPagination
-    filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
+    cursor_pagination_class = ManhwaCursorPagination
+    filter_backends = [SearchFilter, DjangoFilterBackend, StableOrderingFilter]
     search_fields = ('en_title',)
     ordering_fields = ('publication_datetime', 'avg_rating')
     filterset_fields = ('day_of_week', 'genres', 'studio')
     # filterset_class = ManhwaFilter
-    queryset = Manhwa.objects.prefetch_related( 'comments' ,'rates')
-
-# ---- many query in filter --------
-    def get_queryset(self):
-        base_query = Manhwa.objects.prefetch_related('comments').all()
-        if self.action == 'list':
-            return base_query.prefetch_related('rates').annotate(
-                avg_rating=Coalesce(Avg('rates__rating'), Value(0.0)),
-            )
-        return base_query
+    queryset = Manhwa.objects.all()
+    counter_fields = (
+        'views_count', 'comments_count', 'rating_sum', 'raters_count', *Manhwa.RATING_COUNT_FIELDS.values()
+    )
 
     def get_serializer_class(self):
         match self.action:
@@ -220,16 +246,28 @@ class ManhwaViewSet(ModelViewSet):
             return [IsAuthenticated()]
         return [AllowAny()]
 
+    def retrieve(self, request, *args, **kwargs):
+        if not kwargs['pk'].isdigit():
+            raise NotFound
+
+        def build_payload():
+            manhwa = self.get_object()
+            tag, last_modified = self.object_validators(manhwa)
+            return {'tag': tag, 'last_modified': last_modified, 'data': dict(self.get_serializer(manhwa).data)}
+
+        # validators are cached with payload, so a 304 always matches the body client has
+        payload = get_or_build(
+            manhwa_detail_name(kwargs['pk']), 'api', build_payload, MANHWA_DETAIL_CACHE_TIMEOUT
+        )
+        return self.conditional_response(payload['tag'], lambda: Response(payload['data']), payload['last_modified'])
+
     @action(detail=True, methods=['post'])
     def set_view(self, request, pk=None):
-        view_obj, created = View.objects.get_or_create(
-            user=request.user,
-            manhwa_id=pk
-        )
-        if created:
-            Manhwa.objects.filter(pk=pk).update(views_count=F('views_count') + 1)
-            return Response(status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_200_OK)
+        if not pk.isdigit() or not Manhwa.objects.filter(pk=pk).exists():  # pk lookup, no row lock
+            raise NotFound
+        # saved and counted later by flush_views command, without locking manhwa row here
+        record_view(request.user.id, pk)
+        return Response(status=status.HTTP_202_ACCEPTED)
 
     @action(detail=True, methods=['post', 'get'])
     def rate(self, request, pk=None):
@@ -243,14 +281,112 @@ class ManhwaViewSet(ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED if serializer.was_created else status.HTTP_200_OK)
 
 
-class EpisodeViewSet(ReadOnlyModelViewSet):
+class EpisodeViewSet(ConditionalGetMixin, CursorOptInMixin, ReadOnlyModelViewSet):
     serializer_class = srilzr.EpisodeSerializer
+    cursor_pagination_class = EpisodeCursorPagination
+
+    def retrieve(self, request, *args, **kwargs):
+        if not kwargs['pk'].isdigit():
+            raise NotFound
+        return super().retrieve(request, *args, **kwargs)
 
     def get_queryset(self):
         manhwa_pk = self.kwargs.get('manhwa_pk')
         return Episode.objects.filter(manhwa_id=manhwa_pk)
 
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def byte_range(header, size):
+    """
+    (start, end) of a single range 'bytes=start-end' of Range header, end is inclusive.
+    None if header is malformed or has many ranges, then whole file is sent.
+    start is not less than size if range is not satisfiable.
+    """
+    unit, _, ranges = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        return None
+
+    first, _, last = ranges.strip().partition('-')
+    try:
+        if first:  # bytes=start- or bytes=start-end
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:  # bytes=-suffix_length, last bytes of file
+            suffix = int(last)
+            if suffix == 0:
+                return size, size
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        return None
+    return start, end
+
+
+def file_chunks(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+@require_safe
+def episode_download(request, manhwa_pk, pk):
+    """
+    download episode file, with Range (resumable downloads).
+    a download is counted when file is requested from its first byte, parts of a resumed download
+    are not counted again. counts are buffered and added to downloads_count by flush_views.
+    """
+    episode = get_object_or_404(Episode.objects.only('id', 'file', 'datetime_modified'), pk=pk, manhwa_id=manhwa_pk)
+    try:
+        size = episode.file.size
+    except OSError:  # file is missing in storage
+        raise Http404
+    etag = quote_etag(f'{episode.pk}-{size}-{int(episode.datetime_modified.timestamp())}')
+    filename = os.path.basename(episode.file.name)
+
+    requested = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (if_range is None or if_range == etag):  # If-Range: file not changed
+        requested = byte_range(request.headers['Range'], size)
+    if requested and requested[0] >= size:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if request.method == 'GET' and (requested is None or requested[0] == 0):
+        record_download(episode.pk)
+
+    if settings.EPISODE_DOWNLOAD_ACCEL_REDIRECT:
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.EPISODE_DOWNLOAD_ACCEL_REDIRECT + episode.file.name
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    elif requested is None:
+        response = FileResponse(episode.file.open('rb'), as_attachment=True, filename=filename)
+    else:
+        start, end = requested
+        response = StreamingHttpResponse(
+            file_chunks(episode.file.open('rb'), start, end - start + 1),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def api_reaction_handler(request):
@@ -260,16 +396,11 @@ def api_reaction_handler(request):
     comment_id = serializer.validated_data.get('comment_id')
     reaction = serializer.validated_data.get('reaction')
     try:
-        reaction_obj, action = CommentReAction.objects.toggle_reaction(
+        reaction_obj, action, comment_data = CommentReAction.objects.toggle_reaction_counts(
             request.user,
             comment_id=comment_id,
             reaction=reaction
         )
-
-        # get reaction count from db
-        comment_data = Comment.objects.only('id', 'likes_count', 'dis_likes_count').get(pk=comment_id)
-        comment_data = {'likes_count': comment_data.likes_count, 'dis_likes_count': comment_data.dis_likes_count}
-
         reaction_data = srilzr.CommentReactionSerializer(reaction_obj).data if action != 'deleted' else None
 
         response = {
@@ -277,12 +408,38 @@ def api_reaction_handler(request):
             'reaction': reaction_data,
             'comment': comment_data
         }
+    except Comment.DoesNotExist:
+        return Response({'comment_id': ['comment not found']}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     return Response(response, status=status.HTTP_200_OK)
 
 
+class CommentReactionBatchApiView(GenericAPIView):
+    """apply queued reactions of user (e.g. replayed by offline clients) in one request"""
+    permission_classes = (IsAuthenticated,)
+    serializer_class = srilzr.CommentReactionBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        final = serializer.save()
+
+        comments = Comment.objects.with_reaction_counts().only(
+            'id', 'likes_count', 'dis_likes_count'
+        ).filter(pk__in=final).order_by('pk')
+        requested = {pair['comment_id'] for pair in serializer.validated_data['reactions']}
+
+        return Response({
+            'comments': [
+                {'id': comment.id, 'reaction': final[comment.id], **comment.reaction_counts()}
+                for comment in comments
+            ],
+            'not_found': sorted(requested - final.keys()),
+        }, status=status.HTTP_200_OK)
+
+
 def delete_db(model_class):
     table_name = model_class._meta.db_table
     with connection.cursor() as cursor:
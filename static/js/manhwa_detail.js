@@ -2,6 +2,8 @@ const form = document.getElementById('comment-form');
 const comments_list = document.getElementById('comments-list');
 
 let isCommentsLoaded = false;
+let isEpisodesLoaded = false;
+let episodesNext = null;
 
 let mainCommentId = null;
 
@@ -64,12 +66,34 @@ async function load_comments(){
     isCommentsLoaded = true
 }
 
+// episodes are loaded by pages of keyset pagination, next page by 'more episodes' button
+async function load_episodes(url){
+    const response = await fetch(url, {
+            method: 'GET',
+            headers: {
+                'Tab-Load': 'episodes'
+            }
+        })
+    const data = await response.json()
+    document.querySelector('.episode-list').insertAdjacentHTML('beforeend', data.html)
+    episodesNext = data.next
+    document.querySelector('.load-episodes').style.display = episodesNext ? 'block' : 'none'
+    isEpisodesLoaded = true
+}
+
+document.querySelector('.load-episodes').addEventListener('click', async function (){
+    if (episodesNext) await load_episodes(episodesNext)
+})
+
 document.querySelector('.tabs').addEventListener('click', async function (e){
     const tab = e.target.closest('.tab')
     const lastTab = document.querySelector('.tab-active')
     if (tab.classList.contains('tab-comments')){
         await load_comments()
     }
+    if (tab.classList.contains('tab-episodes') && !isEpisodesLoaded){
+        await load_episodes(`/detail/${manhwa_id}/`)
+    }
     lastTab.classList.remove('tab-active')
     tab.classList.add('tab-active')
     changeTab(lastTab.classList[1], tab.classList[1])